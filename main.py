@@ -1,6 +1,7 @@
 import src.evaluation as evaluation
 import src.constants as constants
 import src.crud_interface as crud
+import src.jobs as jobs
 
 from src.preprocess_input import Preprocessor
 from src.guard import Guard
@@ -18,8 +19,9 @@ def main():
         # R: Read the input
         x: str = input(">> ")
 
-        # Exit REPL if input is one of the QUIT_COMMANDS
+        # Exit REPL if input is one of the QUIT_COMMANDS (unfinished background jobs are cancelled)
         if x in constants.QUIT_COMMANDS:
+            jobs.shutdown()
             break
 
         # Call pipeline to preprocess input string x and get command and query (split at seperator token)
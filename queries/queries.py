@@ -12,7 +12,7 @@ QUERY1 =    """
             """
 
 QUERY2 =    """
-            SELECT article.id, LENGTH(article.full_text) as length
+            SELECT article.id, article.full_text_length as length
             FROM article
             WHERE article.headline_main NOT LIKE '%News%'
                 AND article.headline_main NOT LIKE '%Update%'
@@ -20,26 +20,26 @@ QUERY2 =    """
             """
 
 QUERY3 =    """
-            SELECT DATE(article.date_published), count(article.date_published)
+            SELECT DATE(article.published_day * 86400, 'unixepoch') as date, count(article.date_published)
             FROM article
-            GROUP BY DATE(article.date_published)
+            GROUP BY article.published_day
             ORDER BY count(article.date_published) DESC
             """
 
 
 QUERY4 =    """
-            SELECT STRFTIME("%m-%Y", article.date_published) as Month,
+            SELECT PRINTF("%02d-%d", article.published_month % 100, article.published_month / 100) as Month,
                 count(article.date_published)
             FROM article
-            GROUP BY STRFTIME("%m-%Y", article.date_published)
+            GROUP BY article.published_month
             ORDER BY count(article.date_published) DESC
             """
 
 
 QUERY5 =    """
-            SELECT DATE(article.date_published), article.channel, count(article.channel)
+            SELECT DATE(article.published_day * 86400, 'unixepoch') as date, article.channel, count(article.channel)
             FROM article
-            GROUP BY article.channel, DATE(article.date_published)
+            GROUP BY article.channel, article.published_day
             ORDER BY count(article.channel) DESC
             """
 
@@ -71,7 +71,7 @@ QUERY7 =    """
 
 QUERY8 =    """
             WITH split(id, token, str) AS (
-                SELECT id, '', full_text||' ' FROM (SELECT * FROM article LIMIT 1)
+                SELECT id, '', DECOMPRESS(full_text)||' ' FROM (SELECT * FROM article LIMIT 1)
                 UNION ALL SELECT id,
                 substr(str, 0, instr(str, ' ')),
                 substr(str, instr(str, ' ')+1)
@@ -79,5 +79,36 @@ QUERY8 =    """
             ) SELECT id, token, ROW_NUMBER() OVER(ORDER BY id)-1 AS token_position FROM split WHERE token!=''
             """
 
+# Variants of QUERY1 and QUERY6 for the normalized schema ('normalize database') that group by integer keys
+QUERY1_NORMALIZED = """
+            SELECT topic.topic_name, topic_count.num as "count(topic_name)"
+            FROM
+                (SELECT in_topic_key.topic_key, count(*) as num
+                FROM article JOIN in_topic_key ON article.key == in_topic_key.article_key
+                WHERE article.comments_enabled == 0
+                GROUP BY in_topic_key.topic_key) as topic_count
+            JOIN topic ON topic.key == topic_count.topic_key
+            ORDER BY topic_count.num DESC
+            """
+
+
+QUERY6_NORMALIZED = """
+            SELECT department.department_name, author.author_name, MAX(temp.num)
+
+            FROM
+                (SELECT in_department_key.department_key, authored_by_key.author_key, COUNT(*) as num
+                FROM in_department_key JOIN authored_by_key
+                    ON in_department_key.article_key == authored_by_key.article_key
+                GROUP BY in_department_key.department_key, authored_by_key.author_key) as temp
+            JOIN department ON department.key == temp.department_key
+            JOIN author ON author.key == temp.author_key
+
+            GROUP BY temp.department_key
+            ORDER BY MAX(temp.num) DESC
+            """
+
 # Store them in list for importing
 QUERIES_LIST = [QUERY1, QUERY2, QUERY3, QUERY4, QUERY5, QUERY6, QUERY7, QUERY8]
+
+# Same queries as QUERIES_LIST, to be used once the database is normalized
+NORMALIZED_QUERIES_LIST = [QUERY1_NORMALIZED, QUERY2, QUERY3, QUERY4, QUERY5, QUERY6_NORMALIZED, QUERY7, QUERY8]
@@ -0,0 +1,92 @@
+"""
+Module that stores vectorized pandas versions of the example queries from Exercise 02
+
+They run against the tables of the columnar snapshot (see src/snapshot.py), which only holds the metadata
+columns, so QUERY8 (tokenizes full_text) has no rollup and still runs as SQL.
+"""
+import pandas as pd
+
+from typing import Dict
+
+Tables = Dict[str, pd.DataFrame]
+
+
+def _value_counts(series: pd.Series) -> pd.Series:
+    """ Counts the values of a (categorical) series, without the categories that do not occur """
+    counts = series.value_counts()
+    return counts[counts > 0]
+
+
+def _day_to_date(days: pd.Series) -> pd.Series:
+    """ Converts days since 1970-01-01 into ISO dates like DATE(day * 86400, 'unixepoch') """
+    return pd.to_datetime(days.astype("int64"), unit="D").dt.strftime("%Y-%m-%d")
+
+
+def rollup1(tables: Tables) -> pd.DataFrame:
+    """ QUERY1: Number of articles per topic with comments disabled """
+    article = tables["article"]
+    in_topic = tables["in_topic"]
+    ids = article.loc[article["comments_enabled"] == 0, "id"]
+    counts = _value_counts(in_topic.loc[in_topic["article_id"].isin(ids), "topic_name"])
+    return pd.DataFrame({"topic_name": counts.index.astype(str), "count(topic_name)": counts.values})
+
+
+def rollup2(tables: Tables) -> pd.DataFrame:
+    """ QUERY2: Length of the articles without 'News' or 'Update' in the headline """
+    article = tables["article"]
+    headline = article["headline_main"].astype(object)
+    mask = ~headline.str.contains("news", case=False, regex=False, na=True) \
+        & ~headline.str.contains("update", case=False, regex=False, na=True)
+    df = article.loc[mask, ["id", "full_text_length"]].rename(columns={"full_text_length": "length"})
+    return df.sort_values("length", ascending=False, kind="stable").reset_index(drop=True)
+
+
+def rollup3(tables: Tables) -> pd.DataFrame:
+    """ QUERY3: Number of published articles per day """
+    counts = tables["article"].groupby("published_day").size().sort_values(ascending=False, kind="stable")
+    return pd.DataFrame({"date": _day_to_date(counts.index.to_series()).values,
+                         "count(article.date_published)": counts.values})
+
+
+def rollup4(tables: Tables) -> pd.DataFrame:
+    """ QUERY4: Number of published articles per month """
+    counts = tables["article"].groupby("published_month").size().sort_values(ascending=False, kind="stable")
+    months = counts.index.to_series().astype("int64")
+    return pd.DataFrame({"Month": ((months % 100).astype(str).str.zfill(2) + "-" + (months // 100).astype(str)).values,
+                         "count(article.date_published)": counts.values})
+
+
+def rollup5(tables: Tables) -> pd.DataFrame:
+    """ QUERY5: Number of published articles per channel and day """
+    article = tables["article"]
+    counts = article.groupby([article["channel"].astype(object), "published_day"]).size()
+    counts = counts.sort_values(ascending=False, kind="stable").reset_index(name="count(article.channel)")
+    return pd.DataFrame({"date": _day_to_date(counts["published_day"]).values,
+                         "channel": counts["channel"].values,
+                         "count(article.channel)": counts["count(article.channel)"].values})
+
+
+def rollup6(tables: Tables) -> pd.DataFrame:
+    """ QUERY6: Author with the most articles per department """
+    ids = tables["article"]["id"]
+    in_department = tables["in_department"]
+    authored_by = tables["authored_by"]
+    pairs = in_department[in_department["article_id"].isin(ids)].astype(object).merge(
+        authored_by.astype(object), on="article_id")
+    counts = pairs.groupby(["department_name", "author_name"]).size().reset_index(name="num")
+    best = counts.loc[counts.groupby("department_name")["num"].idxmax()]
+    best = best.sort_values("num", ascending=False, kind="stable").reset_index(drop=True)
+    return best.rename(columns={"num": "MAX(temp.num)"})
+
+
+def rollup7(tables: Tables) -> pd.DataFrame:
+    """ QUERY7: Number of authors per article """
+    article = tables["article"]
+    counts = _value_counts(tables["authored_by"]["article_id"]).rename("authored_by_n")
+    df = article[["id", "headline_main"]].astype(object).merge(
+        counts.rename_axis("id").reset_index().astype({"id": object}), on="id")
+    return df.sort_values("authored_by_n", ascending=False, kind="stable").reset_index(drop=True)
+
+
+# Store them in list for importing, aligned with QUERIES_LIST
+ROLLUPS_LIST = [rollup1, rollup2, rollup3, rollup4, rollup5, rollup6, rollup7, None]
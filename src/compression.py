@@ -0,0 +1,73 @@
+""" Module that handles the compressed storage of the large text columns (intro, full_text) """
+import re
+import zlib
+
+from collections import Counter
+from typing import List, Union
+
+# zlib only looks back 32 KiB, so a larger preset dictionary would be ignored
+DICTIONARY_SIZE = 32 * 1024
+
+# Compression level used for all stored texts
+COMPRESSION_LEVEL = 9
+
+# Word n-grams that are considered as dictionary candidates during training
+_NGRAM_SIZES = (1, 2, 3)
+_WORD_PATTERN = re.compile(r"\S+\s*")
+
+
+def train_dictionary(samples: List[str], size: int = DICTIONARY_SIZE) -> bytes:
+    """ Trains a preset dictionary for zlib from a list of sample texts
+
+    Counts word n-grams over all samples and keeps the fragments that save the most bytes (count * length)
+    until the dictionary is full. zlib encodes closer matches with fewer bits, so the most valuable fragments
+    are placed at the end of the dictionary.
+
+    :param samples: List[str] -- Sample texts, e.g. a subset of the full_text column
+    :param size: int -- Maximum size of the dictionary in bytes
+    :return: bytes -- Preset dictionary
+    """
+    counter = Counter()
+    for sample in samples:
+        tokens = _WORD_PATTERN.findall(sample)
+        for n in _NGRAM_SIZES:
+            counter.update("".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+
+    # Fragments that appear only once do not help compressing other texts
+    scored = [(count * len(fragment.encode()), fragment) for fragment, count in counter.items() if count > 1]
+    scored.sort(reverse=True)
+
+    fragments: List[bytes] = []
+    used = 0
+    for _, fragment in scored:
+        encoded = fragment.encode()
+        if used + len(encoded) > size:
+            continue
+        fragments.append(encoded)
+        used += len(encoded)
+
+    return b"".join(reversed(fragments))
+
+
+def compress_text(text: Union[str, None], dictionary: bytes) -> Union[bytes, None]:
+    """ Compresses a text with the given preset dictionary (None stays None) """
+    if text is None:
+        return None
+    compressor = zlib.compressobj(COMPRESSION_LEVEL, zdict=dictionary)
+    return compressor.compress(text.encode()) + compressor.flush()
+
+
+def decompress_text(value: Union[str, bytes, None], dictionary: Union[bytes, None]) -> Union[str, None]:
+    """ Returns the plain text of a stored value
+
+    Compressed values are stored as BLOBs while plain values stay TEXT, so both kinds can live in the same
+    column (e.g. while migrating) and are told apart by their type.
+
+    :param value: Union[str, bytes, None] -- Value as stored in the database
+    :param dictionary: Union[bytes, None] -- Preset dictionary the value was compressed with
+    :return: Union[str, None] -- Plain text
+    """
+    if not isinstance(value, bytes):
+        return value
+    decompressor = zlib.decompressobj(zdict=dictionary)
+    return (decompressor.decompress(value) + decompressor.flush()).decode()
@@ -1,5 +1,7 @@
 # List of commands to support
-COMMANDS = ["help", "query", "describe database", "add directory", "remove directory", "lookup", "example", "plot"]
+COMMANDS = ["help", "query", "describe database", "add directory", "add unique directory", "jobs", "cancel job",
+            "watch", "update directory", "remove directory", "lookup", "related", "between", "example", "plot",
+            "duplicates", "snapshot", "normalize database", "compress database", "decompress database"]
 
 # List of quit / exist statements
 QUIT_COMMANDS = ["q", "quit", "exit"]
@@ -10,5 +12,24 @@ SEPERATOR = "$"
 # Path to the database
 PATH_DB = 'data/articles.db'
 
+# Path to the directory of the columnar snapshot used for analytics
+PATH_SNAPSHOT_DIR = 'data/snapshot/'
+
+# Path to the directory of the TF-IDF index used by the related command
+PATH_TFIDF_DIR = 'data/tfidf/'
+
+# Seconds a write waits for the lock held by another writer, e.g. the background ingestion
+WRITE_TIMEOUT = 60
+
+# Number of JSON files the background ingestion commits per batch
+INGESTION_BATCH_SIZE = 500
+
+# Watch mode: seconds without new events before a batch is applied, seconds between scans when polling,
+# maximum number of files per batch and maximum seconds a change waits while events keep coming in
+WATCH_DEBOUNCE = 0.5
+WATCH_POLL_INTERVAL = 2
+WATCH_MAX_BATCH = 500
+WATCH_MAX_DELAY = 5
+
 # Path to output dir for saving figure
 PATH_OUTPUT_DIR = "output/"
@@ -1,24 +1,65 @@
 import os
 import json
+import time
+import hashlib
 import sqlite3
 
+import numpy as np
+
 import src.constants as constants
+import src.minhash as minhash
+import src.snapshot as snapshot
+import src.tfidf as tfidf
 
+from collections import defaultdict
+from datetime import datetime, timezone
+from src.compression import train_dictionary, compress_text, decompress_text
 from src.data_classes import Article, Headline, Author
-from typing import List
+from typing import List, Union, Dict, Tuple
+
+# Columns of the article table that are read back into the Article DAO
+ARTICLE_DAO_COLUMNS = ["id", "date_created", "date_published", "date_modified", "channel", "subchannel",
+                       "comments_enabled", "headline_main", "headline_social", "intro", "full_text", "url"]
+
+# Columns of the article table that are derived from the DAO columns on insertion
+ARTICLE_DERIVED_COLUMNS = ["intro_length", "full_text_length", "content_hash",
+                           "published_epoch", "published_day", "published_month"]
+
+# All columns of the article table in insertion order
+ARTICLE_COLUMNS = ARTICLE_DAO_COLUMNS + ARTICLE_DERIVED_COLUMNS
+
+# Junction tables, their name column and the dimension table of the normalized schema ('normalize database')
+JUNCTION_TABLES = [("authored_by", "author_name", "author"), ("in_department", "department_name", "department"),
+                   ("in_topic", "topic_name", "topic"), ("has_breadcrumb", "breadcrumb", "breadcrumb")]
+
+# Large text columns that are stored compressed once 'compress database' was run
+COMPRESSED_COLUMNS = ["intro", "full_text"]
+
+# Directories below data/ that hold derived files (e.g. their manifest.json) instead of articles
+DERIVED_DATA_DIRS = [constants.PATH_SNAPSHOT_DIR, constants.PATH_TFIDF_DIR]
+
+
+def is_derived_data_dir(dir_path: str) -> bool:
+    """ Whether the directory is (inside) one of the DERIVED_DATA_DIRS, whose JSON files are no articles """
+    dir_path = os.path.abspath(dir_path)
+    return any(os.path.commonpath([dir_path, os.path.abspath(derived_dir)]) == os.path.abspath(derived_dir)
+               for derived_dir in DERIVED_DATA_DIRS)
 
 
 def get_path_to_data(root_dir: str = './data') -> List[str]:
     """ Utility function that returns a list of file paths
 
     Recursively iterates over the data folder and adds files (+ its root) to the data list,
-    which it also returns.
+    which it also returns. The DERIVED_DATA_DIRS are skipped.
 
     :param root_dir: str -- Root directory
     :return: file_paths: List[str] -- List of file paths to the json files
     """
     file_paths: List = []
     for root, dirs, files in os.walk(root_dir):
+        if is_derived_data_dir(root):
+            dirs.clear()
+            continue
         for file in files:
             if file.endswith('.json'):
                 file_paths.append(os.path.join(root, file))
@@ -37,9 +78,17 @@ def load_articles(root: str) -> List[Article]:
     """
     # Get path to all JSON files
     data_paths: list = get_path_to_data(root_dir=root)
+    return load_articles_from_paths(data_paths)
 
+
+def load_articles_from_paths(file_paths: List[str]) -> List[Article]:
+    """ Loads the given JSON files as Article Objects, see load_articles()
+
+    :param file_paths: List[str] -- File paths to the json files
+    :return: List[Article] -- List of Article Objects
+    """
     articles: List[Article] = []
-    for file_path in data_paths:
+    for file_path in file_paths:
         with open(file_path) as json_file:
             # Load JSON file
             f = json.load(json_file)
@@ -51,6 +100,40 @@ def load_articles(root: str) -> List[Article]:
     return articles
 
 
+def content_hash(article: Article) -> str:
+    """ Returns a hash over all stored fields of an article, used by upsertMany() to detect modified articles
+
+    :param article: Article
+    :return: str -- Hex digest
+    """
+    content = [article.id, article.date_created.isoformat(), article.date_published.isoformat(),
+               article.date_modified.isoformat(), article.channel, article.subchannel, bool(article.comments_enabled),
+               article.headline.main, article.headline.social, article.intro, article.text, article.url,
+               sorted(set(article.author.names)), sorted(set(article.author.departments)),
+               sorted(set(article.topics)), sorted(set(article.breadcrumbs))]
+    return hashlib.sha1(json.dumps(content, ensure_ascii=False).encode()).hexdigest()
+
+
+def date_buckets(date: datetime) -> dict:
+    """ Returns the integer representations of date_published that are stored for fast date-range queries
+
+    Like SQLite's DATE() / STRFTIME(), dates with an offset are bucketed in UTC and dates without one are
+    treated as UTC.
+
+    :param date: datetime
+    :return: dict -- published_epoch (seconds), published_day (days since 1970-01-01), published_month (YYYYMM)
+    """
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    utc_date = date.astimezone(timezone.utc)
+    epoch = int(utc_date.timestamp())
+    return {
+        'published_epoch': epoch,
+        'published_day': epoch // 86400,
+        'published_month': utc_date.year * 100 + utc_date.month
+    }
+
+
 def make_dicts(articles):
     """ Utility function provided by supervisor to create dictionaries from List of Article DAO
 
@@ -76,7 +159,11 @@ def make_dicts(articles):
             'headline_social': article.headline.social,
             'intro': article.intro,
             'full_text': article.text,
-            'url': article.url
+            'url': article.url,
+            'intro_length': len(article.intro) if article.intro is not None else None,
+            'full_text_length': len(article.text) if article.text is not None else None,
+            'content_hash': content_hash(article),
+            **date_buckets(article.date_published)
         })
 
         for author in article.author.names:
@@ -100,6 +187,9 @@ def create_database() -> None:
     :return: None
     """
     with sqlite3.connect(constants.PATH_DB) as connection:
+        # Write-ahead logging lets the background ingestion commit while the REPL keeps reading
+        connection.execute("PRAGMA journal_mode=WAL")
+
         cursor = connection.cursor()
         # Create article table
         cursor.execute("""
@@ -116,9 +206,60 @@ def create_database() -> None:
                     intro TEXT,
                     full_text TEXT,
                     url TEXT,
+                    intro_length INTEGER,
+                    full_text_length INTEGER,
+                    content_hash TEXT,
+                    published_epoch INTEGER,
+                    published_day INTEGER,
+                    published_month INTEGER,
                     PRIMARY KEY(id))
         """)
 
+        # Create article_minhash table, stores the MinHash signature of the full_text per article
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS article_minhash(
+                    article_id TEXT NOT NULL,
+                    signature BLOB NOT NULL,
+                    PRIMARY KEY(article_id)
+                    FOREIGN KEY(article_id) REFERENCES article(id))
+        """)
+
+        # Create minhash_band table, the LSH index that maps the bucket of each signature band to its articles
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS minhash_band(
+                    band INTEGER NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    article_id TEXT NOT NULL,
+                    PRIMARY KEY(band, bucket, article_id)
+                    FOREIGN KEY(article_id) REFERENCES article(id))
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS minhash_band_article_id ON minhash_band(article_id)")
+
+        # Add columns that were introduced after the first schema version to existing databases
+        _migrate_article_table(cursor)
+
+        # Create indices on the date buckets, so that date ranges are answered with an index range scan
+        cursor.execute("CREATE INDEX IF NOT EXISTS article_published_epoch ON article(published_epoch)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS article_published_day ON article(published_day)")
+
+        # Create text_codec table, holds the preset dictionary if the text columns are stored compressed
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS text_codec(
+                    id INTEGER NOT NULL,
+                    dictionary BLOB NOT NULL,
+                    PRIMARY KEY(id))
+        """)
+
+        # Create source_file table, remembers which JSON file holds which article for the watch mode
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS source_file(
+                    path TEXT NOT NULL,
+                    article_id TEXT NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    PRIMARY KEY(path))
+        """)
+
         # Create authored_by table
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS authored_by(
@@ -156,6 +297,84 @@ def create_database() -> None:
         """)
 
 
+def _migrate_article_table(cursor: sqlite3.Cursor) -> None:
+    """ Adds missing columns to an article table created by an older version and backfills them
+
+    :param cursor: sqlite3.Cursor
+    :return: None
+    """
+    cursor.execute("PRAGMA table_info(article)")
+    existing_columns = [row[1] for row in cursor.fetchall()]
+
+    if "intro_length" not in existing_columns:
+        cursor.execute("ALTER TABLE article ADD COLUMN intro_length INTEGER")
+        cursor.execute("UPDATE article SET intro_length = LENGTH(intro)")
+
+    if "full_text_length" not in existing_columns:
+        cursor.execute("ALTER TABLE article ADD COLUMN full_text_length INTEGER")
+        cursor.execute("UPDATE article SET full_text_length = LENGTH(full_text)")
+
+    # Stays NULL for existing articles, upsertMany() compares them column by column and fills it in
+    if "content_hash" not in existing_columns:
+        cursor.execute("ALTER TABLE article ADD COLUMN content_hash TEXT")
+
+    if "published_epoch" not in existing_columns:
+        cursor.execute("ALTER TABLE article ADD COLUMN published_epoch INTEGER")
+        cursor.execute("ALTER TABLE article ADD COLUMN published_day INTEGER")
+        cursor.execute("ALTER TABLE article ADD COLUMN published_month INTEGER")
+        cursor.execute("""
+            UPDATE article SET
+                published_epoch = CAST(STRFTIME('%s', date_published) AS INTEGER),
+                published_day = CAST(STRFTIME('%s', date_published) AS INTEGER) / 86400,
+                published_month = CAST(STRFTIME('%Y%m', date_published) AS INTEGER)
+        """)
+
+
+def load_dictionary(cursor: sqlite3.Cursor) -> Union[bytes, None]:
+    """ Returns the preset dictionary of the compressed text columns or None if they are stored as plain text """
+    cursor.execute("SELECT dictionary FROM text_codec WHERE id == 1")
+    result = cursor.fetchone()
+    return result[0] if result is not None else None
+
+
+def connect() -> sqlite3.Connection:
+    """ Opens a connection to articles.db that can read the compressed text columns
+
+    Registers the SQL function DECOMPRESS(column), so that statements like
+    "SELECT id FROM article WHERE DECOMPRESS(full_text) LIKE '%Covid%'" work on compressed and plain databases.
+
+    :return: sqlite3.Connection
+    """
+    connection = sqlite3.connect(constants.PATH_DB)
+    dictionary = load_dictionary(connection.cursor())
+    connection.create_function("DECOMPRESS", 1, lambda value: decompress_text(value, dictionary),
+                               deterministic=True)
+    return connection
+
+
+def connect_for_writing() -> sqlite3.Connection:
+    """ Opens a connection to articles.db whose transaction holds the write lock from the start
+
+    In WAL mode a transaction that has read before another connection committed cannot be upgraded to a
+    write transaction and fails with 'database is locked'. BEGIN IMMEDIATE instead waits (up to WRITE_TIMEOUT)
+    until e.g. the background ingestion committed its current batch.
+
+    :return: sqlite3.Connection
+    """
+    connection = sqlite3.connect(constants.PATH_DB, timeout=constants.WRITE_TIMEOUT)
+    connection.execute("BEGIN IMMEDIATE")
+    return connection
+
+
+def decompress_columns(rows: List[dict], dictionary: Union[bytes, None]) -> List[dict]:
+    """ Decompresses the compressed text columns of the given rows in place and returns them """
+    for row in rows:
+        for column in COMPRESSED_COLUMNS:
+            if column in row:
+                row[column] = decompress_text(row[column], dictionary)
+    return rows
+
+
 def create(article: Article):
     """ Puts the given article: Article input in articles.db """
     assert isinstance(article, Article)
@@ -165,47 +384,199 @@ def create(article: Article):
     createMany(article_list)
 
 
-def createMany(articles: List[Article]) -> None:
+def createMany(articles: List[Article], skip_near_duplicates: bool = False) -> List[Article]:
     """ Insert data into the article.db as seen in Exercise 01
 
+    Also stores the MinHash signature and LSH bands of each article for the near-duplicate detection.
+
     :param articles: List[Article] -- List of Article DAOs
-    :return: None
+    :param skip_near_duplicates: bool -- Whether to skip articles that are near-duplicates of stored articles
+        or of preceding articles in the list
+    :return: List[Article] -- Articles that were skipped as near-duplicates
     """
-    with sqlite3.connect(constants.PATH_DB) as connection:
-        article_dicts, authored_by_dicts, in_department_dicts, \
-            in_topic_dicts, has_breadcrumb_dicts = make_dicts(articles)
+    with connect_for_writing() as connection:
+        cursor = connection.cursor()
+        stored_ids = set()
+        for chunk in _chunks(list({article.id for article in articles})):
+            cursor.execute(f"SELECT id FROM article WHERE id IN ({', '.join('?' * len(chunk))})", chunk)
+            stored_ids.update(row[0] for row in cursor.fetchall())
+        skipped, inserted = _insert_articles(cursor, articles, skip_near_duplicates, stored_ids)
+
+    # Junction rows of stored articles may have been added, so the snapshot refreshes all of them
+    snapshot.refresh([article.id for article in articles])
+    tfidf.refresh({article.id: article.text for article in inserted})
+    return skipped
+
+
+def _insert_articles(cursor: sqlite3.Cursor, articles: List[Article], skip_near_duplicates: bool,
+                     stored_ids: set) -> Tuple[List[Article], List[Article]]:
+    """ Inserts the articles with the given cursor, see createMany()
+
+    INSERT OR IGNORE keeps stored articles and the first of several kept articles with the same id, so only the
+    articles that were actually inserted get a MinHash signature and LSH bands.
+
+    :param cursor: sqlite3.Cursor
+    :param articles: List[Article] -- List of Article DAOs
+    :param skip_near_duplicates: bool -- Whether to skip near-duplicates
+    :param stored_ids: set -- Ids of the articles among them that are stored already
+    :return: Tuple[List[Article], List[Article]] -- Articles that were skipped as near-duplicates and articles
+        that were inserted
+    """
+    signature_matrix = minhash.signatures([article.text for article in articles])
+
+    skipped: List[Article] = []
+    if skip_near_duplicates:
+        mask = _near_duplicate_mask(cursor, articles, signature_matrix)
+        skipped = [article for article, keep in zip(articles, mask) if not keep]
+        articles = [article for article, keep in zip(articles, mask) if keep]
+        signature_matrix = signature_matrix[mask]
+
+    article_dicts, authored_by_dicts, in_department_dicts, \
+        in_topic_dicts, has_breadcrumb_dicts = make_dicts(articles)
+
+    # Compress the large text columns if the database was migrated with 'compress database'
+    dictionary = load_dictionary(cursor)
+    if dictionary is not None:
+        for article_dict in article_dicts:
+            for column in COMPRESSED_COLUMNS:
+                article_dict[column] = compress_text(article_dict[column], dictionary)
+
+    # Insert article_dicts into article table
+    cursor.executemany(f"""
+        INSERT OR IGNORE INTO article ({", ".join(ARTICLE_COLUMNS)}) VALUES
+        ({", ".join(":" + column for column in ARTICLE_COLUMNS)})
+    """, article_dicts)
+
+    # Insert authored_by_dicts into authored_by table
+    cursor.executemany("""
+        INSERT OR IGNORE INTO authored_by VALUES
+        (:article_id, :author_name)
+    """, authored_by_dicts)
+
+    # Insert in_department_dicts into in_department table
+    cursor.executemany("""
+        INSERT OR IGNORE INTO in_department VALUES
+        (:article_id, :department_name)
+    """, in_department_dicts)
+
+    # Insert in_topic_dicts in in_topic table
+    cursor.executemany("""
+        INSERT OR IGNORE INTO in_topic VALUES
+        (:article_id, :topic_name)
+    """, in_topic_dicts)
+
+    # Insert has_breadcrumb_dicts in has_breadcrumb table
+    cursor.executemany("""
+        INSERT OR IGNORE INTO has_breadcrumb VALUES
+        (:article_id, :breadcrumb)
+    """, has_breadcrumb_dicts)
+
+    # Insert signatures of the inserted articles into article_minhash and minhash_band table
+    inserted_positions: Dict[str, int] = {}
+    for position, article in enumerate(articles):
+        if article.id not in stored_ids:
+            inserted_positions.setdefault(article.id, position)
+    positions = list(inserted_positions.values())
+    _insert_signatures(cursor, list(inserted_positions), signature_matrix[positions])
+
+    return skipped, [articles[position] for position in positions]
+
+
+def upsertMany(articles: List[Article]) -> Dict[str, int]:
+    """ Inserts new articles and applies modifications of stored articles to articles.db
+
+    Stored articles whose content_hash matches or that were modified later than the incoming version are left
+    untouched. For the others only the changed article columns and the changed junction rows (authors, topics,
+    departments, breadcrumbs) are rewritten, both in bulk.
 
+    :param articles: List[Article] -- List of Article DAOs
+    :return: Dict[str, int] -- Number of unchanged, updated and inserted articles and of the junction rows
+        that were inserted / deleted for the updated articles
+    """
+    # Keep only the latest version if an article occurs several times
+    latest: Dict[str, Article] = {}
+    for article in articles:
+        if article.id not in latest or article.date_modified > latest[article.id].date_modified:
+            latest[article.id] = article
+    articles = list(latest.values())
+
+    with connect_for_writing() as connection:
         cursor = connection.cursor()
-        # Insert article_dicts into article table
-        cursor.executemany("""
-            INSERT OR IGNORE INTO article VALUES
-            (:id, :date_created, :date_published, :date_modified, :channel, :subchannel,
-             :comments_enabled, :headline_main, :headline_social, :intro, :full_text, :url)
-        """, article_dicts)
-
-        # Insert authored_by_dicts into authored_by table
-        cursor.executemany("""
-            INSERT OR IGNORE INTO authored_by VALUES
-            (:article_id, :author_name)
-        """, authored_by_dicts)
-
-        # Insert in_department_dicts into in_department table
-        cursor.executemany("""
-            INSERT OR IGNORE INTO in_department VALUES
-            (:article_id, :department_name)
-        """, in_department_dicts)
-
-        # Insert in_topic_dicts in in_topic table
-        cursor.executemany("""
-            INSERT OR IGNORE INTO in_topic VALUES
-            (:article_id, :topic_name)
-        """, in_topic_dicts)
-
-        # Insert has_breadcrumb_dicts in has_breadcrumb table
-        cursor.executemany("""
-            INSERT OR IGNORE INTO has_breadcrumb VALUES
-            (:article_id, :breadcrumb)
-        """, has_breadcrumb_dicts)
+        dictionary = load_dictionary(cursor)
+
+        # Get the stored versions of the incoming articles
+        stored: Dict[str, dict] = {}
+        for chunk in _chunks([article.id for article in articles]):
+            cursor.execute(f"SELECT {', '.join(ARTICLE_COLUMNS)} FROM article "
+                           f"WHERE id IN ({', '.join('?' * len(chunk))})", chunk)
+            for row in cursor.fetchall():
+                stored[row[0]] = dict(zip(ARTICLE_COLUMNS, row))
+
+        new_articles = [article for article in articles if article.id not in stored]
+        candidates = [article for article in articles if article.id in stored
+                      and stored[article.id]["content_hash"] != content_hash(article)
+                      and datetime.fromisoformat(stored[article.id]["date_modified"]) <= article.date_modified]
+
+        article_dicts, *junction_dicts = make_dicts(candidates)
+
+        # Group the changed article columns, so that each combination is written with one executemany
+        column_updates = defaultdict(list)
+        changed_ids = set()
+        text_changed_ids = []
+        for article_dict in article_dicts:
+            stored_row = decompress_columns([dict(stored[article_dict["id"]])], dictionary)[0]
+            changed_columns = tuple(column for column in ARTICLE_COLUMNS if article_dict[column] != stored_row[column])
+            if set(changed_columns) - set(ARTICLE_DERIVED_COLUMNS):
+                changed_ids.add(article_dict["id"])
+            if "full_text" in changed_columns:
+                text_changed_ids.append(article_dict["id"])
+            if dictionary is not None:
+                for column in set(changed_columns) & set(COMPRESSED_COLUMNS):
+                    article_dict[column] = compress_text(article_dict[column], dictionary)
+            column_updates[changed_columns].append(article_dict)
+
+        for changed_columns, dicts in column_updates.items():
+            cursor.executemany(f"UPDATE article SET {', '.join(f'{c} = :{c}' for c in changed_columns)} "
+                               f"WHERE id == :id", dicts)
+
+        # Apply the difference of the junction rows
+        junction_rows_inserted = 0
+        junction_rows_deleted = 0
+        candidate_ids = [article.id for article in candidates]
+        for (table, name_column, _), dicts in zip(JUNCTION_TABLES, junction_dicts):
+            incoming_rows = {(d["article_id"], d[name_column]) for d in dicts}
+            stored_rows = set()
+            for chunk in _chunks(candidate_ids):
+                cursor.execute(f"SELECT article_id, {name_column} FROM {table} "
+                               f"WHERE article_id IN ({', '.join('?' * len(chunk))})", chunk)
+                stored_rows.update(cursor.fetchall())
+
+            rows_to_insert = incoming_rows - stored_rows
+            rows_to_delete = stored_rows - incoming_rows
+            cursor.executemany(f"INSERT OR IGNORE INTO {table} VALUES (?, ?)", list(rows_to_insert))
+            cursor.executemany(f"DELETE FROM {table} WHERE article_id == (?) AND {name_column} == (?)",
+                               list(rows_to_delete))
+            changed_ids.update(article_id for article_id, _ in rows_to_insert | rows_to_delete)
+            junction_rows_inserted += len(rows_to_insert)
+            junction_rows_deleted += len(rows_to_delete)
+
+        # Replace the signatures of articles with a modified full_text
+        cursor.executemany("DELETE FROM article_minhash WHERE article_id == (?)", [[i] for i in text_changed_ids])
+        cursor.executemany("DELETE FROM minhash_band WHERE article_id == (?)", [[i] for i in text_changed_ids])
+        text_changed = [latest[article_id] for article_id in text_changed_ids]
+        _insert_signatures(cursor, text_changed_ids, minhash.signatures([article.text for article in text_changed]))
+
+        _insert_articles(cursor, new_articles, skip_near_duplicates=False, stored_ids=set())
+
+    snapshot.refresh(sorted(changed_ids) + [article.id for article in new_articles])
+    tfidf.refresh({article.id: article.text for article in text_changed + new_articles})
+    return {
+        "unchanged": len(articles) - len(new_articles) - len(changed_ids),
+        "updated": len(changed_ids),
+        "inserted": len(new_articles),
+        "junction_rows_inserted": junction_rows_inserted,
+        "junction_rows_deleted": junction_rows_deleted
+    }
 
 
 def read(article_id: str) -> Article:
@@ -231,14 +602,15 @@ def read(article_id: str) -> Article:
         results_in_topic = cursor.fetchall()
         topics_list = [x[0] for x in results_in_topic]
 
-        # Get Dictionary of Article table
-        cursor.execute("SELECT * FROM article WHERE id == (?)", [article_id])
+        # Get Dictionary of Article table (without the precomputed length columns)
+        cursor.execute(f"SELECT {', '.join(ARTICLE_DAO_COLUMNS)} FROM article WHERE id == (?)", [article_id])
         results_article = cursor.fetchone()
         try:
             rowDict = dict(zip([c[0] for c in cursor.description], results_article))
         except TypeError:
             print(f"Could not find an entry with the id: {article_id}")
             return None
+        decompress_columns([rowDict], load_dictionary(cursor))
 
         # Get list of departments
         cursor.execute("SELECT department_name FROM in_department WHERE article_id == (?)", [article_id])
@@ -282,6 +654,58 @@ def readMany(article_ids: List[str]) -> List[Article]:
     return article_list
 
 
+def _to_epoch(date: Union[str, datetime]) -> int:
+    """ Converts an ISO date string or datetime into seconds since epoch (UTC if it has no offset) """
+    if isinstance(date, str):
+        date = datetime.fromisoformat(date)
+    return date_buckets(date)["published_epoch"]
+
+
+def listBetween(start: Union[str, datetime], end: Union[str, datetime],
+                columns: List[str] = ("id", "headline_main", "date_published")) -> List[tuple]:
+    """ Returns the given columns of the articles published in [start, end) ordered by date_published
+
+    Filtering on the indexed published_epoch column results in one index range scan.
+
+    :param start: Union[str, datetime] -- Start of the window (inclusive), e.g. '2023-01-01'
+    :param end: Union[str, datetime] -- End of the window (exclusive), e.g. '2023-02-01'
+    :param columns: List[str] -- Columns of the article table to return (not the compressed text columns)
+    :return: List[tuple] -- One row per article
+    """
+    if not set(columns) <= set(ARTICLE_COLUMNS) - set(COMPRESSED_COLUMNS):
+        raise ValueError(f"Invalid columns: {columns}")
+    with sqlite3.connect(constants.PATH_DB) as connection:
+        cursor = connection.cursor()
+        cursor.execute(f"SELECT {', '.join(columns)} FROM article "
+                       f"WHERE published_epoch >= (?) AND published_epoch < (?) "
+                       f"ORDER BY published_epoch", [_to_epoch(start), _to_epoch(end)])
+        return cursor.fetchall()
+
+
+def findBetween(start: Union[str, datetime], end: Union[str, datetime]) -> List[str]:
+    """ Returns the ids of the articles published in [start, end) ordered by date_published, see listBetween()
+
+    :param start: Union[str, datetime] -- Start of the window (inclusive), e.g. '2023-01-01'
+    :param end: Union[str, datetime] -- End of the window (exclusive), e.g. '2023-02-01'
+    :return: List[str] -- Article ids
+    """
+    return [x[0] for x in listBetween(start, end, columns=["id"])]
+
+
+def countBetween(start: Union[str, datetime], end: Union[str, datetime]) -> int:
+    """ Returns the number of articles published in [start, end), see findBetween()
+
+    :param start: Union[str, datetime] -- Start of the window (inclusive)
+    :param end: Union[str, datetime] -- End of the window (exclusive)
+    :return: int
+    """
+    with sqlite3.connect(constants.PATH_DB) as connection:
+        cursor = connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM article WHERE published_epoch >= (?) AND published_epoch < (?)",
+                       [_to_epoch(start), _to_epoch(end)])
+        return cursor.fetchone()[0]
+
+
 def delete(article: Article) -> bool:
     """ Deletes the article in the database """
     if article is None:
@@ -299,7 +723,7 @@ def deleteMany(articles: List[Article]) -> None:
     :param articles: List[Article]
     :return: None
     """
-    with sqlite3.connect(constants.PATH_DB) as connection:
+    with connect_for_writing() as connection:
         article_dicts, authored_by_dicts, in_department_dicts, \
             in_topic_dicts, has_breadcrumb_dicts = make_dicts(articles)
 
@@ -318,3 +742,507 @@ def deleteMany(articles: List[Article]) -> None:
 
         cursor.executemany("DELETE FROM has_breadcrumb WHERE article_id=:article_id and breadcrumb=:breadcrumb",
                            has_breadcrumb_dicts)
+
+        cursor.executemany("DELETE FROM article_minhash WHERE article_id=:id", article_dicts)
+
+        cursor.executemany("DELETE FROM minhash_band WHERE article_id=:id", article_dicts)
+
+    snapshot.refresh([article.id for article in articles])
+    tfidf.refresh({article.id: None for article in articles})
+
+
+def load_source_files() -> Dict[str, tuple]:
+    """ Returns the JSON files known to the watch mode
+
+    :return: Dict[str, tuple] -- path -> (article_id, mtime_ns, size) at the time the file was ingested
+    """
+    with sqlite3.connect(constants.PATH_DB) as connection:
+        cursor = connection.cursor()
+        cursor.execute("SELECT path, article_id, mtime_ns, size FROM source_file")
+        return {path: (article_id, mtime_ns, size) for path, article_id, mtime_ns, size in cursor.fetchall()}
+
+
+def save_source_files(source_files: Dict[str, Union[tuple, None]]) -> None:
+    """ Stores (or forgets) the JSON files ingested by the watch mode
+
+    :param source_files: Dict[str, Union[tuple, None]] -- path -> (article_id, mtime_ns, size), None if deleted
+    :return: None
+    """
+    with connect_for_writing() as connection:
+        cursor = connection.cursor()
+        cursor.executemany("INSERT OR REPLACE INTO source_file VALUES (?, ?, ?, ?)",
+                           [(path, *values) for path, values in source_files.items() if values is not None])
+        cursor.executemany("DELETE FROM source_file WHERE path == (?)",
+                           [[path] for path, values in source_files.items() if values is None])
+
+
+def _chunks(items: list, size: int = 900) -> List[list]:
+    """ Splits a list into chunks that stay below the SQLite limit of variables per statement """
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _insert_signatures(cursor: sqlite3.Cursor, article_ids: List[str], signature_matrix: np.ndarray) -> None:
+    """ Stores the MinHash signatures and LSH bands of the given articles
+
+    :param cursor: sqlite3.Cursor
+    :param article_ids: List[str] -- Ids of the articles, aligned with the rows of signature_matrix
+    :param signature_matrix: np.ndarray -- Signatures returned by minhash.signatures()
+    :return: None
+    """
+    band_matrix = minhash.bands(signature_matrix)
+    signature_dicts = []
+    band_dicts = []
+    for article_id, signature, buckets in zip(article_ids, signature_matrix, band_matrix):
+        signature_dicts.append({"article_id": article_id, "signature": minhash.to_blob(signature)})
+        if minhash.is_empty(signature):
+            continue
+        for band, bucket in enumerate(buckets.tolist()):
+            band_dicts.append({"band": band, "bucket": bucket, "article_id": article_id})
+
+    cursor.executemany("INSERT OR IGNORE INTO article_minhash VALUES (:article_id, :signature)", signature_dicts)
+    cursor.executemany("INSERT OR IGNORE INTO minhash_band VALUES (:band, :bucket, :article_id)", band_dicts)
+
+
+def _fetch_signatures(cursor: sqlite3.Cursor, article_ids: List[str]) -> Dict[str, np.ndarray]:
+    """ Returns the stored signatures of the given articles as dictionary article_id -> signature """
+    signatures: Dict[str, np.ndarray] = {}
+    for chunk in _chunks(list(article_ids)):
+        cursor.execute(f"SELECT article_id, signature FROM article_minhash "
+                       f"WHERE article_id IN ({', '.join('?' * len(chunk))})", chunk)
+        rows = cursor.fetchall()
+        for article_id, signature in zip([row[0] for row in rows], minhash.from_blobs([row[1] for row in rows])):
+            signatures[article_id] = signature
+    return signatures
+
+
+def _near_duplicate_mask(cursor: sqlite3.Cursor, articles: List[Article], signature_matrix: np.ndarray) -> np.ndarray:
+    """ Returns a mask of the articles that are no near-duplicate of a stored or a preceding article
+
+    Candidates are only the articles that share at least one LSH bucket, stored candidates are looked up with
+    a single join against minhash_band, candidates within the list with a dictionary of the kept buckets.
+
+    :param cursor: sqlite3.Cursor
+    :param articles: List[Article] -- Incoming articles
+    :param signature_matrix: np.ndarray -- Their signatures returned by minhash.signatures()
+    :return: np.ndarray -- Boolean mask, True for articles to keep
+    """
+    band_matrix = minhash.bands(signature_matrix)
+    empty = [minhash.is_empty(signature) for signature in signature_matrix]
+
+    # Look up the stored articles that share a bucket with an incoming article
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS incoming_band(position INTEGER, band INTEGER, bucket INTEGER)")
+    cursor.execute("DELETE FROM incoming_band")
+    cursor.executemany("INSERT INTO incoming_band VALUES (?, ?, ?)",
+                       [(position, band, bucket) for position, buckets in enumerate(band_matrix.tolist())
+                        if not empty[position] for band, bucket in enumerate(buckets)])
+    cursor.execute("""
+        SELECT DISTINCT incoming_band.position, minhash_band.article_id
+        FROM incoming_band JOIN minhash_band
+            ON minhash_band.band == incoming_band.band AND minhash_band.bucket == incoming_band.bucket
+    """)
+    stored_candidates = defaultdict(list)
+    for position, article_id in cursor.fetchall():
+        stored_candidates[position].append(article_id)
+    cursor.execute("DROP TABLE incoming_band")
+
+    stored_signatures = _fetch_signatures(cursor, {a for ids in stored_candidates.values() for a in ids})
+
+    mask = np.ones(len(articles), dtype=bool)
+    kept_buckets = defaultdict(list)
+    for position, article in enumerate(articles):
+        if empty[position]:
+            continue
+
+        candidates = [stored_signatures[a] for a in stored_candidates[position]
+                      if a != article.id and a in stored_signatures]
+        candidates += [signature_matrix[p] for p in
+                       {p for band, bucket in enumerate(band_matrix[position].tolist())
+                        for p in kept_buckets[(band, bucket)] if articles[p].id != article.id}]
+        if candidates:
+            candidate_matrix = np.stack(candidates)
+            repeated = np.repeat(signature_matrix[position][None, :], len(candidates), axis=0)
+            if (minhash.similarities(repeated, candidate_matrix) >= minhash.SIMILARITY_THRESHOLD).any():
+                mask[position] = False
+                continue
+
+        for band, bucket in enumerate(band_matrix[position].tolist()):
+            kept_buckets[(band, bucket)].append(position)
+
+    return mask
+
+
+def iter_article_texts(batch_size: int = 1000):
+    """ Yields the full_text of all stored articles in batches, e.g. to build the TF-IDF index
+
+    :param batch_size: int -- Number of articles per batch
+    :return: Generator of List[Tuple[str, str]] -- Batches of (article_id, full_text)
+    """
+    with sqlite3.connect(constants.PATH_DB) as connection:
+        cursor = connection.cursor()
+        dictionary = load_dictionary(cursor)
+        last_rowid = 0
+        while True:
+            cursor.execute("SELECT rowid, id, full_text FROM article WHERE rowid > (?) ORDER BY rowid LIMIT (?)",
+                           [last_rowid, batch_size])
+            rows = cursor.fetchall()
+            if not rows:
+                return
+            yield [(article_id, decompress_text(full_text, dictionary)) for _, article_id, full_text in rows]
+            last_rowid = rows[-1][0]
+
+
+def index_minhash(batch_size: int = 1000) -> int:
+    """ Computes the missing signatures of articles that were stored before the near-duplicate detection existed
+
+    Each batch is read and signed without holding the write lock and then committed in its own short write
+    transaction, so background ingestion jobs can write in between.
+
+    :param batch_size: int -- Number of articles to sign per batch
+    :return: int -- Number of newly signed articles
+    """
+    indexed = 0
+    last_rowid = 0
+    while True:
+        with sqlite3.connect(constants.PATH_DB) as connection:
+            cursor = connection.cursor()
+            dictionary = load_dictionary(cursor)
+            cursor.execute("""
+                SELECT article.rowid, article.id, article.full_text
+                FROM article LEFT JOIN article_minhash ON article_minhash.article_id == article.id
+                WHERE article_minhash.article_id IS NULL AND article.rowid > (?)
+                ORDER BY article.rowid
+                LIMIT (?)
+            """, [last_rowid, batch_size])
+            rows = cursor.fetchall()
+        if not rows:
+            break
+        last_rowid = rows[-1][0]
+        signature_matrix = minhash.signatures([decompress_text(full_text, dictionary) for _, _, full_text in rows])
+
+        with connect_for_writing() as connection:
+            cursor = connection.cursor()
+            # Skip articles that were deleted since they were read
+            article_ids = [article_id for _, article_id, _ in rows]
+            still_stored = set()
+            for chunk in _chunks(article_ids):
+                cursor.execute(f"SELECT id FROM article WHERE id IN ({', '.join('?' * len(chunk))})", chunk)
+                still_stored.update(row[0] for row in cursor.fetchall())
+            mask = np.array([article_id in still_stored for article_id in article_ids], dtype=bool)
+            _insert_signatures(cursor, [i for i, keep in zip(article_ids, mask) if keep], signature_matrix[mask])
+        indexed += int(mask.sum())
+
+    return indexed
+
+
+def find_near_duplicates(threshold: float = minhash.SIMILARITY_THRESHOLD) -> List[List[str]]:
+    """ Returns the clusters of near-identical articles in articles.db
+
+    Candidate pairs are the articles that share an LSH bucket (no pairwise comparison of all articles), their
+    estimated similarity is then checked at once and the verified pairs are merged into clusters (union find).
+
+    :param threshold: float -- Estimated Jaccard similarity from which two articles are near-duplicates
+    :return: List[List[str]] -- Clusters of article ids, largest cluster first
+    """
+    index_minhash()
+
+    with sqlite3.connect(constants.PATH_DB) as connection:
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT DISTINCT a.article_id, b.article_id
+            FROM minhash_band a JOIN minhash_band b
+                ON a.band == b.band AND a.bucket == b.bucket AND a.article_id < b.article_id
+        """)
+        pairs = cursor.fetchall()
+        if not pairs:
+            return []
+
+        article_ids = sorted({article_id for pair in pairs for article_id in pair})
+        signatures = _fetch_signatures(cursor, article_ids)
+
+    left = np.stack([signatures[a] for a, _ in pairs])
+    right = np.stack([signatures[b] for _, b in pairs])
+    verified = [pair for pair, similarity in zip(pairs, minhash.similarities(left, right)) if similarity >= threshold]
+
+    # Union find over the verified pairs
+    parent = {article_id: article_id for article_id in article_ids}
+
+    def find(article_id: str) -> str:
+        while parent[article_id] != article_id:
+            parent[article_id] = parent[parent[article_id]]
+            article_id = parent[article_id]
+        return article_id
+
+    for a, b in verified:
+        parent[find(a)] = find(b)
+
+    clusters = defaultdict(list)
+    for a, b in verified:
+        clusters[find(a)].extend([a, b])
+
+    return sorted([sorted(set(cluster)) for cluster in clusters.values()], key=len, reverse=True)
+
+
+def is_normalized(cursor: sqlite3.Cursor) -> bool:
+    """ Whether the junction tables were migrated to the normalized schema with 'normalize database' """
+    cursor.execute("SELECT type FROM sqlite_master WHERE name == 'authored_by'")
+    result = cursor.fetchone()
+    return result is not None and result[0] == "view"
+
+
+def normalize_database() -> Union[None, dict]:
+    """ Migrates the junction tables of articles.db to a dictionary-encoded schema with integer surrogate keys
+
+    The article table is rebuilt with an integer surrogate key (key, an alias of the rowid) and every author /
+    department / topic / breadcrumb name is interned once in its dimension table. The junction tables only store
+    pairs of integer keys (e.g. authored_by_key) and are replaced by views with the old name and columns.
+    INSTEAD OF triggers on these views intern new names, so existing SQL statements and all CRUD operations keep
+    working unchanged. Deleting an article deletes its junction rows.
+
+    :return: Union[None, dict] -- Size of the database file before / after or None if it was normalized already
+    """
+    with sqlite3.connect(constants.PATH_DB) as connection:
+        if is_normalized(connection.cursor()):
+            return None
+        connection.execute("VACUUM")
+    file_bytes_before = _get_database_file_size()
+
+    connection = sqlite3.connect(constants.PATH_DB, timeout=constants.WRITE_TIMEOUT, isolation_level=None)
+    with connection:
+        cursor = connection.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        _add_article_key(cursor)
+
+        for table, name_column, dimension in JUNCTION_TABLES:
+            # Create the dimension table and intern all names
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {dimension}(
+                        key INTEGER NOT NULL,
+                        {name_column} TEXT NOT NULL UNIQUE,
+                        PRIMARY KEY(key))
+            """)
+            cursor.execute(f"INSERT OR IGNORE INTO {dimension}({name_column}) "
+                           f"SELECT DISTINCT {name_column} FROM {table} ORDER BY {name_column}")
+
+            # Create the junction table of integer keys and copy the rows
+            cursor.execute(f"""
+                CREATE TABLE {table}_key(
+                        article_key INTEGER NOT NULL,
+                        {dimension}_key INTEGER NOT NULL,
+                        PRIMARY KEY(article_key, {dimension}_key)
+                        FOREIGN KEY(article_key) REFERENCES article(key)
+                        FOREIGN KEY({dimension}_key) REFERENCES {dimension}(key)) WITHOUT ROWID
+            """)
+            cursor.execute(f"""
+                INSERT INTO {table}_key
+                SELECT article.key, {dimension}.key
+                FROM {table} JOIN article ON article.id == {table}.article_id
+                    JOIN {dimension} ON {dimension}.{name_column} == {table}.{name_column}
+            """)
+            cursor.execute(f"DROP TABLE {table}")
+
+            # Replace the old table by a compatibility view that can be inserted into and deleted from
+            cursor.execute(f"""
+                CREATE VIEW {table} AS
+                SELECT article.id AS article_id, {dimension}.{name_column} AS {name_column}
+                FROM {table}_key JOIN article ON article.key == {table}_key.article_key
+                    JOIN {dimension} ON {dimension}.key == {table}_key.{dimension}_key
+            """)
+            cursor.execute(f"""
+                CREATE TRIGGER {table}_insert INSTEAD OF INSERT ON {table}
+                BEGIN
+                    INSERT OR IGNORE INTO {dimension}({name_column}) VALUES (NEW.{name_column});
+                    INSERT INTO {table}_key
+                    SELECT article.key, {dimension}.key FROM article, {dimension}
+                    WHERE article.id == NEW.article_id AND {dimension}.{name_column} == NEW.{name_column};
+                END
+            """)
+            cursor.execute(f"""
+                CREATE TRIGGER {table}_delete INSTEAD OF DELETE ON {table}
+                BEGIN
+                    DELETE FROM {table}_key
+                    WHERE article_key == (SELECT key FROM article WHERE id == OLD.article_id)
+                        AND {dimension}_key == (SELECT key FROM {dimension} WHERE {name_column} == OLD.{name_column});
+                END
+            """)
+
+        # Deleting an article deletes its junction rows, which are only reachable through its key
+        cursor.execute(f"""
+            CREATE TRIGGER article_delete AFTER DELETE ON article
+            BEGIN
+                {" ".join(f"DELETE FROM {table}_key WHERE article_key == OLD.key;" for table, _, _ in JUNCTION_TABLES)}
+            END
+        """)
+
+        cursor.execute("COMMIT")
+        cursor.execute("VACUUM")
+    connection.close()
+
+    return {
+        "file_bytes_before": file_bytes_before,
+        "file_bytes_after": _get_database_file_size()
+    }
+
+
+def _add_article_key(cursor: sqlite3.Cursor) -> None:
+    """ Rebuilds the article table with the integer surrogate key column key (INTEGER PRIMARY KEY)
+
+    SQLite cannot add a primary key to an existing table, so the table is copied into a new one with the same
+    columns plus key, keeping the rowid order, and its indexes are recreated.
+
+    :param cursor: sqlite3.Cursor -- Cursor of a connection inside a transaction
+    :return: None
+    """
+    cursor.execute("PRAGMA table_info(article)")
+    columns = [(name, column_type, not_null) for _, name, column_type, not_null, _, _ in cursor.fetchall()]
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type == 'index' AND tbl_name == 'article' AND sql IS NOT NULL")
+    index_statements = [row[0] for row in cursor.fetchall()]
+
+    column_definitions = ", ".join(f"{name} {column_type}{' NOT NULL' if not_null else ''}"
+                                   for name, column_type, not_null in columns)
+    column_names = ", ".join(name for name, _, _ in columns)
+    cursor.execute(f"CREATE TABLE article_new({column_definitions}, key INTEGER PRIMARY KEY, UNIQUE(id))")
+    cursor.execute(f"INSERT INTO article_new({column_names}) SELECT {column_names} FROM article ORDER BY rowid")
+    cursor.execute("DROP TABLE article")
+    cursor.execute("ALTER TABLE article_new RENAME TO article")
+    for index_statement in index_statements:
+        cursor.execute(index_statement)
+
+
+def _get_database_file_size() -> int:
+    """ Returns the size of articles.db in bytes
+
+    In WAL mode recent writes (including VACUUM) only live in the -wal file, so the log is checkpointed into the
+    database file first. Whatever a concurrent reader keeps from being checkpointed is added.
+    Must not be called while a transaction is open.
+    """
+    with sqlite3.connect(constants.PATH_DB, timeout=constants.WRITE_TIMEOUT) as connection:
+        connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    wal_path = constants.PATH_DB + "-wal"
+    wal_bytes = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+    return os.path.getsize(constants.PATH_DB) + wal_bytes
+
+
+def _get_text_storage_bytes(cursor: sqlite3.Cursor) -> int:
+    """ Returns the stored bytes of the compressed text columns """
+    cursor.execute("""
+        SELECT SUM(LENGTH(CAST(intro AS BLOB))), SUM(LENGTH(CAST(full_text AS BLOB)))
+        FROM article
+    """)
+    intro_bytes, full_text_bytes = cursor.fetchone()
+    return (intro_bytes or 0) + (full_text_bytes or 0)
+
+
+def _rewrite_text_columns(connection: sqlite3.Connection, old_dictionary: Union[bytes, None],
+                          new_dictionary: Union[bytes, None], batch_size: int = 1000) -> int:
+    """ Re-encodes intro and full_text of all articles from the old into the new storage format in batches
+
+    :param connection: sqlite3.Connection
+    :param old_dictionary: Union[bytes, None] -- Dictionary the texts are currently stored with (None = plain)
+    :param new_dictionary: Union[bytes, None] -- Dictionary to store the texts with (None = plain)
+    :param batch_size: int -- Number of articles to rewrite per batch
+    :return: int -- Number of rewritten articles
+    """
+    cursor = connection.cursor()
+    last_rowid = 0
+    rewritten = 0
+    while True:
+        cursor.execute("SELECT rowid, intro, full_text FROM article WHERE rowid > (?) ORDER BY rowid LIMIT (?)",
+                       [last_rowid, batch_size])
+        rows = cursor.fetchall()
+        if not rows:
+            break
+
+        updates = []
+        for rowid, intro, full_text in rows:
+            intro = decompress_text(intro, old_dictionary)
+            full_text = decompress_text(full_text, old_dictionary)
+            if new_dictionary is not None:
+                intro = compress_text(intro, new_dictionary)
+                full_text = compress_text(full_text, new_dictionary)
+            updates.append({"rowid": rowid, "intro": intro, "full_text": full_text})
+
+        cursor.executemany("UPDATE article SET intro = :intro, full_text = :full_text WHERE rowid == :rowid",
+                           updates)
+        last_rowid = rows[-1][0]
+        rewritten += len(rows)
+
+    return rewritten
+
+
+def compress_database(sample_size: int = 1000) -> dict:
+    """ Migrates intro and full_text of articles.db to the compressed storage format
+
+    Trains a preset dictionary on a sample of the stored texts, rewrites all articles with it and vacuums
+    the database. New articles are compressed on insertion afterwards. Running it again retrains the dictionary.
+
+    :param sample_size: int -- Number of articles to train the dictionary on
+    :return: dict -- Size and speed report of the migration
+    """
+    file_bytes_before = _get_database_file_size()
+    with connect_for_writing() as connection:
+        cursor = connection.cursor()
+        old_dictionary = load_dictionary(cursor)
+        text_bytes_before = _get_text_storage_bytes(cursor)
+
+        start_time = time.time()
+        cursor.execute("SELECT intro, full_text FROM article ORDER BY RANDOM() LIMIT (?)", [sample_size])
+        samples = [decompress_text(text, old_dictionary) or "" for row in cursor.fetchall() for text in row]
+        dictionary = train_dictionary(samples)
+        train_duration = time.time() - start_time
+
+        start_time = time.time()
+        rewritten = _rewrite_text_columns(connection, old_dictionary, dictionary)
+        cursor.execute("INSERT OR REPLACE INTO text_codec VALUES (1, (?))", [dictionary])
+        rewrite_duration = time.time() - start_time
+
+    return _finish_text_migration(text_bytes_before, file_bytes_before, rewritten, train_duration, rewrite_duration,
+                                  len(dictionary))
+
+
+def decompress_database() -> dict:
+    """ Migrates intro and full_text of articles.db back to plain TEXT storage
+
+    :return: dict -- Size and speed report of the migration
+    """
+    file_bytes_before = _get_database_file_size()
+    with connect_for_writing() as connection:
+        cursor = connection.cursor()
+        old_dictionary = load_dictionary(cursor)
+        text_bytes_before = _get_text_storage_bytes(cursor)
+
+        start_time = time.time()
+        rewritten = _rewrite_text_columns(connection, old_dictionary, None)
+        cursor.execute("DELETE FROM text_codec")
+        rewrite_duration = time.time() - start_time
+
+    return _finish_text_migration(text_bytes_before, file_bytes_before, rewritten, 0.0, rewrite_duration, 0)
+
+
+def _finish_text_migration(text_bytes_before: int, file_bytes_before: int, rewritten: int, train_duration: float,
+                           rewrite_duration: float, dictionary_bytes: int) -> dict:
+    """ Vacuums the database after a migration and measures the sizes and the read speed afterwards """
+    with sqlite3.connect(constants.PATH_DB) as connection:
+        connection.execute("VACUUM")
+        cursor = connection.cursor()
+        text_bytes_after = _get_text_storage_bytes(cursor)
+
+        # Measure how fast all texts can be read back in their new format
+        dictionary = load_dictionary(cursor)
+        start_time = time.time()
+        cursor.execute("SELECT intro, full_text FROM article")
+        for intro, full_text in cursor:
+            decompress_text(intro, dictionary)
+            decompress_text(full_text, dictionary)
+        read_duration = time.time() - start_time
+
+    return {
+        "articles": rewritten,
+        "dictionary_bytes": dictionary_bytes,
+        "text_bytes_before": text_bytes_before,
+        "text_bytes_after": text_bytes_after,
+        "file_bytes_before": file_bytes_before,
+        "file_bytes_after": _get_database_file_size(),
+        "train_seconds": train_duration,
+        "rewrite_seconds": rewrite_duration,
+        "read_seconds": read_duration
+    }
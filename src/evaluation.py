@@ -1,4 +1,5 @@
 """ Module that handles the evaluation of the commands and corresponding queries """
+import os
 import sqlite3
 import time
 import datetime
@@ -9,10 +10,16 @@ import seaborn as sns
 import src.constants as constants
 import src.utils as utils
 import src.crud_interface as crud_interface
+import src.snapshot as snapshot
+import src.jobs as jobs
+import src.tfidf as tfidf
+import src.watcher as watcher
 
 from typing import Union, List
+from src.compression import decompress_text
 from src.data_classes import Article
-from queries.queries import QUERIES_LIST
+from queries.queries import QUERIES_LIST, NORMALIZED_QUERIES_LIST
+from queries.rollups import ROLLUPS_LIST
 
 
 # Global DataFrames loaded by load_tables() func
@@ -49,18 +56,54 @@ def evaluate_command_and_query(command: str, query: str) -> None:
     if command == "add directory":
         eval_add_directory(query)
 
+    if command == "add unique directory":
+        eval_add_directory(query, skip_near_duplicates=True)
+
+    if command == "jobs":
+        _ = eval_jobs()
+
+    if command == "cancel job":
+        eval_cancel_job(query)
+
+    if command == "watch":
+        eval_watch(query)
+
+    if command == "update directory":
+        eval_update_directory(query)
+
     if command == "remove directory":
         eval_remove_directory(query)
 
     if command == "lookup":
         _ = eval_lookup(query)
 
+    if command == "related":
+        _ = eval_related(query)
+
+    if command == "between":
+        _ = eval_between(query)
+
     if command == "example":
         _ = eval_example(query)
 
     if command == "plot":
         eval_plot(query)
 
+    if command == "duplicates":
+        _ = eval_duplicates()
+
+    if command == "snapshot":
+        eval_snapshot()
+
+    if command == "normalize database":
+        eval_normalize_database()
+
+    if command == "compress database":
+        eval_compress_database()
+
+    if command == "decompress database":
+        eval_decompress_database()
+
     # Print seperator string
     duration = time.time() - start_time
     utils.print_end_string(title_str, duration)
@@ -75,12 +118,23 @@ def eval_help() -> None:
           f"Example statements would be:\n"
           f"\t* query $SQL, e.g. query $select * from article LIMIT 10\n"
           f"\t* describe database, to get information about the tables\n"
-          f"\t* add directory $DIR, e.g. add directory $data/1\n"
+          f"\t* add directory $DIR, e.g. add directory $data/1, runs in the background\n"
+          f"\t* jobs, to see progress, throughput and ETA of the background jobs\n"
+          f"\t* cancel job $ID, e.g. cancel job $1\n"
+          f"\t* watch $DIR, e.g. watch $data to ingest new, modified and deleted JSON files until Ctrl+C\n"
+          f"\t* add unique directory $DIR, like add directory but skips near-duplicates of stored articles\n"
+          f"\t* update directory $DIR, like add directory but also applies modifications of stored articles\n"
           f"\t* remove directory $DIR, e.g. remove directory $data/1\n"
           f"\t* lookup $KEYWORD, e.g. lookup $Covid to search for articles with 'Covid' in it\n"
+          f"\t* related $ARTICLE_ID, to list the articles with the most similar full_text (TF-IDF)\n"
+          f"\t* between $START $END, e.g. between $2023-01-01 $2023-02-01 to list the articles published in January\n"
+          f"\t* duplicates, to list clusters of near-identical articles\n"
           f"\t* example $[1...8], e.g. example $1 to execute first example query\n"
-          f"\t* plot $SQL, e.g. plot $SELECT DATE(article.date_published), count(article.date_published) FROM article "
-          f"GROUP BY DATE(article.date_published) ORDER BY DATE(article.date_published) ASC\n\n"
+          f"\t* plot $SQL, e.g. plot $SELECT DATE(published_day * 86400, 'unixepoch') as date, count(id) FROM article "
+          f"GROUP BY published_day ORDER BY published_day ASC\n"
+          f"\t* snapshot, to export the metadata to a columnar snapshot that describe database and example use\n"
+          f"\t* normalize database, to store authors, departments, topics and breadcrumbs dictionary-encoded\n"
+          f"\t* compress database, to store intro and full_text compressed (reversible with decompress database)\n\n"
           f"To exit the REPL use one of the following commands:\n"
           f"{constants.QUIT_COMMANDS}")
 
@@ -93,12 +147,19 @@ def eval_query(query, verbose: bool = True) -> Union[None, pd.DataFrame]:
     :return: Union[None, pd.DataFrame]
     """
     try:
-        with sqlite3.connect(constants.PATH_DB) as connection:
+        with crud_interface.connect() as connection:
             df = pd.read_sql(query, connection)
+            dictionary = crud_interface.load_dictionary(connection.cursor())
     except pd.errors.DatabaseError:
         print(f"Invalid SQL statement! Please try again and use a valid SQL statement.")
         return None
 
+    # Decompress the large text columns, if they are stored compressed
+    if dictionary is not None:
+        for column in crud_interface.COMPRESSED_COLUMNS:
+            if column in df.columns:
+                df[column] = df[column].map(lambda value: decompress_text(value, dictionary))
+
     if verbose:
         print(df)
 
@@ -135,19 +196,103 @@ def eval_describe_database() -> None:
           )
 
 
-def eval_add_directory(query) -> None:
-    """ Parsed the JSON files found in the query (dir path) and adds them to the articles.db
+def eval_add_directory(query, skip_near_duplicates: bool = False) -> None:
+    """ Queues the JSON files found in the query (dir path) for background ingestion into articles.db
+
+    Returns immediately, the writer thread commits the files in batches while the REPL keeps serving queries.
+    Use 'jobs' to follow the progress.
 
     :param query: str -- Directory to add Article Objects (e.g. "add directory $../UB1/data/1")
+    :param skip_near_duplicates: bool -- Whether to skip near-duplicates of already stored articles
+    :return: None
+    """
+    if query is None or not os.path.isdir(query):
+        print("Error in provided path! You must provide a directory, e.g. $data/1")
+        return
+
+    job = jobs.submit(query, skip_near_duplicates=skip_near_duplicates)
+    print(f"Queued job #{job.job_id} to add {query} to articles.db in the background ...\n"
+          f"Use 'jobs' to see its progress and 'cancel job ${job.job_id}' to cancel it.")
+
+
+def eval_jobs() -> Union[None, pd.DataFrame]:
+    """ Prints progress, throughput and ETA of the background ingestion jobs """
+    job_list = jobs.get_jobs()
+    if not job_list:
+        print("No jobs yet, 'add directory $DIR' starts one ...")
+        return None
+
+    df = pd.DataFrame([{
+        "job": job.job_id,
+        "directory": job.root,
+        "status": job.status,
+        "files": f"{job.files_done}/{job.files_total if job.files_total is not None else '?'}",
+        "skipped": job.articles_skipped,
+        "files/s": round(job.throughput(), 1),
+        "eta [s]": round(job.eta(), 1) if job.eta() is not None else None,
+        "error": job.error
+    } for job in job_list])
+    print(df.to_string(index=False))
+    return df
+
+
+def eval_cancel_job(query) -> None:
+    """ Cancels the background ingestion job with the id given as query
+
+    :param query: str -- Job id
+    :return: None
+    """
+    try:
+        job_id = int(query)
+    except (TypeError, ValueError):
+        print("Invalid job id, e.g. 'cancel job $1'")
+        return
+
+    if jobs.cancel(job_id):
+        print(f"Cancelling job #{job_id}, articles of already committed batches stay in articles.db ...")
+    else:
+        print(f"There is no queued or running job #{job_id} ...")
+
+
+def eval_watch(query) -> None:
+    """ Keeps articles.db in sync with the JSON files of the directory in the query until Ctrl+C
+
+    :param query: str -- Directory to watch, 'data' if omitted
+    :return: None
+    """
+    root = query or "data"
+    if not os.path.isdir(root):
+        print("Error in provided path! You must provide a directory, e.g. $data")
+        return
+
+    watch = watcher.Watcher(root)
+    print(f"Watching {root} for JSON files ({watch.mode}), press Ctrl+C to stop ...")
+    try:
+        watch.run()
+    except KeyboardInterrupt:
+        pass
+    lag = f", max lag {watch.max_lag:.2f}s" if watch.batches else ""
+    print(f"\nStopped watching {root}: applied {watch.files_applied} files in {watch.batches} batches "
+          f"({watch.files_applied / max(watch.busy_seconds, 1e-9):.0f} files/s while busy){lag}, "
+          f"{watch.files_failed} unreadable")
+
+
+def eval_update_directory(query) -> None:
+    """ Parses the JSON files found in the query (dir path) and upserts them into articles.db
+
+    New articles are inserted, stored articles are only rewritten where they were modified.
+
+    :param query: str -- Directory path
     :return: None
     """
     try:
-        # Read and Parse Data
         articles: List[Article] = crud_interface.load_articles(root=query)
         print(f"Parsed {len(articles)} Articles ...")
-        # Add to articles.db
-        crud_interface.createMany(articles)
-        print(f"Added {len(articles)} Articles to articles.db ...")
+        counts = crud_interface.upsertMany(articles)
+        print(f"Inserted {counts['inserted']}, updated {counts['updated']} and left {counts['unchanged']} "
+              f"Articles unchanged in articles.db ...\n"
+              f"Inserted {counts['junction_rows_inserted']} and deleted {counts['junction_rows_deleted']} "
+              f"author / department / topic / breadcrumb rows of the updated Articles ...")
     except TypeError:
         print("Error in provided path! You must provide a directory, e.g. $data/1")
 
@@ -180,13 +325,86 @@ def eval_lookup(query) -> Union[None, pd.DataFrame]:
     else:
         SQL_STATEMENT = "SELECT article.id, article.headline_main " \
                         "FROM article " \
-                        f"WHERE article.full_text LIKE '%{KEYWORD}%'"
+                        f"WHERE DECOMPRESS(article.full_text) LIKE '%{KEYWORD}%'"
         df = eval_query(SQL_STATEMENT)
         print(f"Found {df.shape[0]} Articles with Keyword '{KEYWORD}' ...")
 
         return df
 
 
+def eval_duplicates() -> Union[None, pd.DataFrame]:
+    """ Lists the clusters of near-identical articles (e.g. republished articles with a new id)
+
+    :return: Union[None, pd.DataFrame] -- One row per article with the number of its cluster
+    """
+    clusters = crud_interface.find_near_duplicates()
+    if not clusters:
+        print("Found no near-duplicate Articles ...")
+        return None
+
+    cluster_df = pd.DataFrame([(number, article_id) for number, cluster in enumerate(clusters)
+                               for article_id in cluster], columns=["cluster", "id"])
+    article_df = eval_query("SELECT id, headline_main, date_published FROM article", verbose=False)
+    df = cluster_df.merge(article_df, on="id", how="left").sort_values(["cluster", "date_published"])
+    print(df)
+    print(f"Found {len(clusters)} clusters with {df.shape[0]} near-duplicate Articles ...")
+
+    return df
+
+
+def eval_related(query) -> Union[None, pd.DataFrame]:
+    """ Lists the articles most similar to the article with the given id (query)
+
+    Builds the TF-IDF index on first use, afterwards it is updated with every write.
+
+    :param query: str -- Article id
+    :return: Union[None, pd.DataFrame]
+    """
+    if query is None:
+        print("Please provide an article id, e.g. 'related $d9def405-3c1d-49c4-913a-c743ffd9691d' ...")
+        return None
+    article_id = query.strip()
+
+    if not tfidf.exists():
+        print("Building TF-IDF index over the full_text of all articles ...")
+        print(f"Indexed {tfidf.build(crud_interface.iter_article_texts())} Articles ...")
+
+    results = tfidf.related(article_id)
+    if results is None:
+        print(f"Could not find an entry with the id: {article_id}")
+        return None
+
+    ids = ", ".join(f"'{related_id}'" for related_id, _ in results)
+    headlines = eval_query(f"SELECT id, headline_main FROM article WHERE id IN ({ids})", verbose=False)
+    df = pd.DataFrame(results, columns=["id", "similarity"]).merge(headlines, on="id", how="left")
+    print(df)
+
+    return df
+
+
+def eval_between(query) -> Union[None, pd.DataFrame]:
+    """ Lists the articles published in the window [START, END) given as query 'START $END'
+
+    :param query: str -- Start and end date separated by the separator token, e.g. '2023-01-01 $2023-02-01'
+    :return: Union[None, pd.DataFrame]
+    """
+    columns = ["id", "headline_main", "date_published"]
+    try:
+        start, end = [date.strip() for date in query.split(constants.SEPERATOR)]
+        rows = crud_interface.listBetween(start, end, columns=columns)
+    except (AttributeError, ValueError):
+        print(f"Invalid date range. Must be two ISO dates, e.g. 'between $2023-01-01 $2023-02-01'")
+        return None
+
+    print(f"Found {len(rows)} Articles published in the given range ...")
+    if not rows:
+        return None
+
+    df = pd.DataFrame(rows, columns=columns)
+    print(df)
+    return df
+
+
 def eval_example(query) -> Union[None, pd.DataFrame]:
     """ Executes the example queries from exercise 02
 
@@ -201,8 +419,15 @@ def eval_example(query) -> Union[None, pd.DataFrame]:
 
     print(f"Executing example query #{query_number} from Exercise 02 ...")
 
+    # Use the vectorized rollup on the snapshot if there is one
+    if snapshot.exists() and 0 <= query_number < len(ROLLUPS_LIST) and ROLLUPS_LIST[query_number] is not None:
+        print("Using the columnar snapshot ...")
+        df = ROLLUPS_LIST[query_number](snapshot.load_tables())
+        print(df)
+        return df
+
     try:
-        example_query = QUERIES_LIST[query_number]
+        example_query = get_example_queries()[query_number]
         df = eval_query(example_query)
         return df
     except IndexError as e:
@@ -253,10 +478,108 @@ def eval_plot(query) -> bool:
     return True
 
 
+def eval_snapshot() -> None:
+    """ (Re)builds the columnar snapshot of articles.db """
+    print("Exporting metadata columns and junction tables ...")
+    report = snapshot.build()
+    print(f"Exported {report['rows']} rows into {constants.PATH_SNAPSHOT_DIR} ({report['bytes']} bytes). "
+          f"It is refreshed after every add / update / remove directory ...")
+
+
+def get_example_queries() -> List[str]:
+    """ Returns the example queries that fit the current schema of articles.db """
+    with sqlite3.connect(constants.PATH_DB) as connection:
+        if crud_interface.is_normalized(connection.cursor()):
+            return NORMALIZED_QUERIES_LIST
+    return QUERIES_LIST
+
+
+def time_queries(queries: List[str], repetitions: int = 3) -> List[float]:
+    """ Returns the best execution time of each query out of several repetitions
+
+    :param queries: List[str] -- SQL statements
+    :param repetitions: int -- Number of executions per query
+    :return: List[float] -- Execution time in seconds per query
+    """
+    durations = []
+    with crud_interface.connect() as connection:
+        for query in queries:
+            best = float("inf")
+            for _ in range(repetitions):
+                start_time = time.time()
+                connection.execute(query).fetchall()
+                best = min(best, time.time() - start_time)
+            durations.append(best)
+    return durations
+
+
+def eval_normalize_database() -> None:
+    """ Migrates articles.db to the normalized schema and prints size and query time measurements """
+    if get_example_queries() is NORMALIZED_QUERIES_LIST:
+        print("articles.db is normalized already ...")
+        return
+    durations_before = time_queries(QUERIES_LIST)
+
+    print("Interning names and replacing the junction tables by compatibility views ...")
+    report = crud_interface.normalize_database()
+
+    durations_views = time_queries(QUERIES_LIST)
+    durations_keys = time_queries(NORMALIZED_QUERIES_LIST)
+
+    print(f"Database file: {report['file_bytes_before']} -> {report['file_bytes_after']} bytes")
+    df = pd.DataFrame({"example": range(1, len(QUERIES_LIST) + 1),
+                       "before [s]": durations_before,
+                       "views [s]": durations_views,
+                       "integer keys [s]": durations_keys})
+    print(df.round(4).to_string(index=False))
+
+
+def eval_compress_database() -> None:
+    """ Migrates the text columns of articles.db to the compressed storage format and prints a report """
+    print("Training dictionary and compressing intro and full_text ...")
+    report = crud_interface.compress_database()
+    print_text_migration_report(report)
+
+
+def eval_decompress_database() -> None:
+    """ Migrates the text columns of articles.db back to plain TEXT and prints a report """
+    print("Decompressing intro and full_text ...")
+    report = crud_interface.decompress_database()
+    print_text_migration_report(report)
+
+
+def print_text_migration_report(report: dict) -> None:
+    """ Prints the size / speed report returned by crud_interface.compress_database() / decompress_database()
+
+    :param report: dict -- Report of the migration
+    :return: None
+    """
+    ratio = report["text_bytes_before"] / max(report["text_bytes_after"], 1)
+    megabytes = report["text_bytes_after"] / 1024 ** 2
+    print(f"Rewrote {report['articles']} Articles (dictionary size: {report['dictionary_bytes']} bytes) ...\n"
+          f"\t* Text columns: {report['text_bytes_before']} -> {report['text_bytes_after']} bytes "
+          f"(ratio {ratio:.2f})\n"
+          f"\t* Database file: {report['file_bytes_before']} -> {report['file_bytes_after']} bytes\n"
+          f"\t* Training: {report['train_seconds']:.2f}s, rewriting: {report['rewrite_seconds']:.2f}s\n"
+          f"\t* Reading all texts: {report['read_seconds']:.2f}s "
+          f"({megabytes / max(report['read_seconds'], 1e-9):.1f} MB/s stored data)")
+
+
 def load_tables() -> None:
     """ Loads all tables from articles.db into the global variables """
 
     global article_df, authored_by_df, has_breadcrumb_df, in_department_df, in_topic_df
+
+    # Map the tables of the snapshot if there is one (without the text columns)
+    tables = snapshot.load_tables()
+    if tables is not None:
+        article_df = tables["article"].sort_values("published_epoch", kind="stable")
+        authored_by_df = tables["authored_by"]
+        has_breadcrumb_df = tables["has_breadcrumb"]
+        in_department_df = tables["in_department"]
+        in_topic_df = tables["in_topic"]
+        return
+
     article_df = eval_query(query='select * from article ORDER BY date_published ASC', verbose=0)
     authored_by_df = eval_query(query='select * from authored_by', verbose=0)
     has_breadcrumb_df = eval_query(query='select * from has_breadcrumb', verbose=0)
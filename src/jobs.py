@@ -0,0 +1,122 @@
+""" Module that handles the background ingestion of directories while the REPL keeps serving queries """
+import time
+import queue
+import threading
+
+import src.constants as constants
+import src.crud_interface as crud_interface
+
+from dataclasses import dataclass, field
+from typing import List, Union
+
+
+@dataclass
+class IngestionJob:
+    job_id: int
+    root: str
+    skip_near_duplicates: bool
+    status: str = "queued"
+    files_total: Union[int, None] = None
+    files_done: int = 0
+    articles_skipped: int = 0
+    started: Union[float, None] = None
+    finished: Union[float, None] = None
+    error: Union[str, None] = None
+    cancel_event: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    def throughput(self) -> float:
+        """ Returns the number of ingested files per second """
+        if self.started is None:
+            return 0.0
+        elapsed = (self.finished or time.time()) - self.started
+        return self.files_done / elapsed if elapsed > 0 else 0.0
+
+    def eta(self) -> Union[float, None]:
+        """ Returns the estimated seconds until the job is done or None if it cannot be estimated yet """
+        if self.status != "running" or self.files_total is None or self.throughput() == 0:
+            return None
+        return (self.files_total - self.files_done) / self.throughput()
+
+
+# All jobs of this session by id and the queue the writer thread takes them from
+_jobs: List[IngestionJob] = []
+_queue: "queue.Queue[Union[IngestionJob, None]]" = queue.Queue()
+_writer: Union[threading.Thread, None] = None
+_lock = threading.Lock()
+
+
+def submit(root: str, skip_near_duplicates: bool = False) -> IngestionJob:
+    """ Queues a directory for ingestion and returns immediately
+
+    :param root: str -- Directory with the JSON files
+    :param skip_near_duplicates: bool -- Whether to skip near-duplicates of stored articles
+    :return: IngestionJob -- The queued job, see get_jobs()
+    """
+    global _writer
+    with _lock:
+        job = IngestionJob(job_id=len(_jobs) + 1, root=root, skip_near_duplicates=skip_near_duplicates)
+        _jobs.append(job)
+        if _writer is None:
+            _writer = threading.Thread(target=_run_writer, name="ingestion-writer", daemon=True)
+            _writer.start()
+    _queue.put(job)
+    return job
+
+
+def get_jobs() -> List[IngestionJob]:
+    """ Returns all jobs of this session """
+    return list(_jobs)
+
+
+def cancel(job_id: int) -> bool:
+    """ Cancels a queued or running job, a running job stops after its current batch
+
+    :param job_id: int
+    :return: bool -- Whether there was an unfinished job with that id
+    """
+    for job in _jobs:
+        if job.job_id == job_id and job.status in ("queued", "running"):
+            job.cancel_event.set()
+            if job.status == "queued":
+                job.status = "cancelled"
+            return True
+    return False
+
+
+def shutdown() -> None:
+    """ Cancels all unfinished jobs and waits until the writer thread committed its current batch """
+    for job in _jobs:
+        job.cancel_event.set()
+    if _writer is not None:
+        _queue.put(None)
+        _writer.join()
+
+
+def _run_writer() -> None:
+    """ Writer thread: Ingests the queued jobs one after another, committing one batch of files at a time """
+    while True:
+        job = _queue.get()
+        if job is None:
+            return
+        if job.cancel_event.is_set():
+            job.status = "cancelled"
+            continue
+
+        job.status = "running"
+        job.started = time.time()
+        try:
+            file_paths = crud_interface.get_path_to_data(root_dir=job.root)
+            job.files_total = len(file_paths)
+            for start in range(0, len(file_paths), constants.INGESTION_BATCH_SIZE):
+                if job.cancel_event.is_set():
+                    break
+                articles = crud_interface.load_articles_from_paths(
+                    file_paths[start:start + constants.INGESTION_BATCH_SIZE])
+                skipped = crud_interface.createMany(articles, skip_near_duplicates=job.skip_near_duplicates)
+                job.articles_skipped += len(skipped)
+                job.files_done += len(articles)
+            job.status = "cancelled" if job.cancel_event.is_set() else "done"
+        except Exception as e:
+            job.status = "failed"
+            job.error = f"{type(e).__name__}: {e}"
+        job.finished = time.time()
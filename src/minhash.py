@@ -0,0 +1,113 @@
+""" Module that handles the MinHash signatures and LSH bands used to detect near-duplicate articles """
+import re
+import zlib
+import numpy as np
+
+from typing import List, Union
+
+# Number of hash permutations per signature
+NUM_PERMUTATIONS = 128
+
+# Number of LSH bands, each band hashes NUM_PERMUTATIONS / NUM_BANDS rows of the signature
+NUM_BANDS = 16
+
+# Number of consecutive words that form one shingle
+SHINGLE_SIZE = 4
+
+# Estimated Jaccard similarity from which two articles count as near-duplicates
+SIMILARITY_THRESHOLD = 0.8
+
+# Signature of texts without any shingles, these are never banded
+EMPTY_VALUE = np.iinfo(np.uint32).max
+
+# Maximum number of shingles hashed at once, bounds the memory of the (permutations x shingles) matrix
+_CHUNK_SHINGLES = 50_000
+
+_PRIME = np.uint64((1 << 31) - 1)
+_rng = np.random.RandomState(2023)
+_A = _rng.randint(1, int(_PRIME), size=NUM_PERMUTATIONS).astype(np.uint64)
+_B = _rng.randint(0, int(_PRIME), size=NUM_PERMUTATIONS).astype(np.uint64)
+_BAND_MULTIPLIERS = _rng.randint(1, 1 << 62, size=NUM_PERMUTATIONS // NUM_BANDS, dtype=np.int64).astype(np.uint64)
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+def shingle_hashes(text: Union[str, None]) -> np.ndarray:
+    """ Returns the unique 32 bit hashes of the word shingles of a text
+
+    :param text: Union[str, None]
+    :return: np.ndarray -- uint64 array of shingle hashes (empty for empty texts)
+    """
+    words = _WORD_PATTERN.findall((text or "").lower())
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+    shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(len(words) - SHINGLE_SIZE + 1, 1))}
+    return np.fromiter((zlib.crc32(shingle.encode()) for shingle in shingles), dtype=np.uint64, count=len(shingles))
+
+
+def signatures(texts: List[Union[str, None]]) -> np.ndarray:
+    """ Computes the MinHash signatures of a batch of texts
+
+    The shingle hashes of several texts are concatenated and permuted at once, the minimum per text is then
+    taken with np.minimum.reduceat, so the work per chunk is a few vectorized operations.
+
+    :param texts: List[Union[str, None]]
+    :return: np.ndarray -- uint32 array of shape (len(texts), NUM_PERMUTATIONS)
+    """
+    result = np.full((len(texts), NUM_PERMUTATIONS), EMPTY_VALUE, dtype=np.uint32)
+    hashes = [shingle_hashes(text) for text in texts]
+
+    start = 0
+    while start < len(texts):
+        # Collect as many texts as fit into one chunk (at least one)
+        end = start
+        total = 0
+        while end < len(texts) and (end == start or total + len(hashes[end]) <= _CHUNK_SHINGLES):
+            total += len(hashes[end])
+            end += 1
+
+        non_empty = [i for i in range(start, end) if len(hashes[i]) > 0]
+        if non_empty:
+            offsets = np.cumsum([0] + [len(hashes[i]) for i in non_empty[:-1]])
+            values = np.concatenate([hashes[i] for i in non_empty])
+            permuted = (_A[:, None] * values[None, :] + _B[:, None]) % _PRIME
+            result[non_empty] = np.minimum.reduceat(permuted, offsets, axis=1).T.astype(np.uint32)
+        start = end
+
+    return result
+
+
+def bands(signature_matrix: np.ndarray) -> np.ndarray:
+    """ Hashes each band of the signatures into one bucket key
+
+    :param signature_matrix: np.ndarray -- uint32 array of shape (n, NUM_PERMUTATIONS)
+    :return: np.ndarray -- int64 array of shape (n, NUM_BANDS), fits into an SQLite INTEGER
+    """
+    rows = signature_matrix.astype(np.uint64).reshape(len(signature_matrix), NUM_BANDS, NUM_PERMUTATIONS // NUM_BANDS)
+    return (rows * _BAND_MULTIPLIERS).sum(axis=2).view(np.int64)
+
+
+def is_empty(signature: np.ndarray) -> bool:
+    """ Whether the signature belongs to a text without shingles """
+    return bool((signature == EMPTY_VALUE).all())
+
+
+def similarities(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """ Estimates the Jaccard similarities of two aligned arrays of signatures
+
+    :param left: np.ndarray -- uint32 array of shape (n, NUM_PERMUTATIONS)
+    :param right: np.ndarray -- uint32 array of shape (n, NUM_PERMUTATIONS)
+    :return: np.ndarray -- float array of shape (n,)
+    """
+    return (left == right).mean(axis=1)
+
+
+def to_blob(signature: np.ndarray) -> bytes:
+    """ Serializes a signature to store it in the database """
+    return signature.astype("<u4").tobytes()
+
+
+def from_blobs(blobs: List[bytes]) -> np.ndarray:
+    """ Deserializes a list of stored signatures into one uint32 matrix """
+    if not blobs:
+        return np.empty((0, NUM_PERMUTATIONS), dtype=np.uint32)
+    return np.frombuffer(b"".join(blobs), dtype="<u4").reshape(len(blobs), NUM_PERMUTATIONS).astype(np.uint32)
@@ -26,9 +26,9 @@ class Preprocessor:
         self.user_input = self.user_input.lower()
 
     def split_command_query(self):
-        """ Splits the query based on the separator token """
+        """ Splits the query based on the first separator token, the query itself may contain further ones """
         try:
-            command, query = self.user_input.split("$")
+            command, query = self.user_input.split("$", 1)
             self.command = command
             self.query = query
         except ValueError as e:
@@ -0,0 +1,205 @@
+""" Module that handles the memory-mapped columnar snapshot of articles.db used for analytics
+
+The snapshot consists of segments. Each segment stores every column of the metadata tables as NumPy array:
+numbers as int64 / float64 (NULL = NaN), strings dictionary-encoded as int32 codes (NULL = -1) plus an array of
+the distinct values. Arrays are loaded with mmap_mode='r', so loading costs next to nothing.
+Writes append a delta segment with the current rows of the touched articles, which supersede their rows in all
+earlier segments. Once there are too many segments, the snapshot is rebuilt.
+"""
+import os
+import json
+import shutil
+import sqlite3
+import threading
+import numpy as np
+import pandas as pd
+
+import src.constants as constants
+
+from typing import List, Dict, Union
+
+# Exported tables, their article id column and their columns with the kind of values ("str" or "int")
+SNAPSHOT_TABLES = {
+    "article": ("id", [("id", "str"), ("date_created", "str"), ("date_published", "str"),
+                       ("date_modified", "str"), ("channel", "str"), ("subchannel", "str"),
+                       ("comments_enabled", "int"), ("headline_main", "str"), ("headline_social", "str"),
+                       ("url", "str"), ("intro_length", "int"), ("full_text_length", "int"),
+                       ("published_epoch", "int"), ("published_day", "int"), ("published_month", "int")]),
+    "authored_by": ("article_id", [("article_id", "str"), ("author_name", "str")]),
+    "has_breadcrumb": ("article_id", [("article_id", "str"), ("breadcrumb", "str")]),
+    "in_department": ("article_id", [("article_id", "str"), ("department_name", "str")]),
+    "in_topic": ("article_id", [("article_id", "str"), ("topic_name", "str")])
+}
+
+# Number of segments from which a refresh rebuilds the snapshot instead of appending another segment
+MAX_SEGMENTS = 16
+
+_MANIFEST = "manifest.json"
+_lock = threading.Lock()
+
+
+def exists() -> bool:
+    """ Whether a snapshot was built with the 'snapshot' command """
+    return os.path.exists(os.path.join(constants.PATH_SNAPSHOT_DIR, _MANIFEST))
+
+
+def _read_manifest() -> dict:
+    with open(os.path.join(constants.PATH_SNAPSHOT_DIR, _MANIFEST)) as manifest_file:
+        return json.load(manifest_file)
+
+
+def _write_manifest(manifest: dict) -> None:
+    """ Replaces the manifest atomically, so readers see either the old or the new list of segments """
+    path = os.path.join(constants.PATH_SNAPSHOT_DIR, _MANIFEST)
+    with open(path + ".tmp", "w") as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(path + ".tmp", path)
+
+
+def _encode_strings(values: list) -> tuple:
+    """ Dictionary-encodes a list of strings into int32 codes (NULL = -1) and an array of the distinct values """
+    dictionary: Dict[str, int] = {}
+    codes = np.fromiter((-1 if value is None else dictionary.setdefault(value, len(dictionary)) for value in values),
+                        dtype=np.int32, count=len(values))
+    return codes, np.array(list(dictionary), dtype=str)
+
+
+def _encode_numbers(values: list) -> np.ndarray:
+    """ Converts a list of integers into an int64 array or a float64 array with NaN if it contains NULLs """
+    if any(value is None for value in values):
+        return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+    return np.array(values, dtype=np.int64)
+
+
+def _write_segment(connection: sqlite3.Connection, segment: str, article_ids: Union[None, List[str]]) -> int:
+    """ Exports the rows of the given articles (or of all articles if None) of all tables into a segment
+
+    :param connection: sqlite3.Connection
+    :param segment: str -- Name of the segment directory
+    :param article_ids: Union[None, List[str]] -- Articles to export, None for a full export
+    :return: int -- Number of exported rows
+    """
+    segment_dir = os.path.join(constants.PATH_SNAPSHOT_DIR, segment)
+    os.makedirs(segment_dir, exist_ok=True)
+    cursor = connection.cursor()
+
+    if article_ids is not None:
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS snapshot_ids(article_id TEXT PRIMARY KEY)")
+        cursor.execute("DELETE FROM snapshot_ids")
+        cursor.executemany("INSERT OR IGNORE INTO snapshot_ids VALUES (?)", [[i] for i in article_ids])
+        np.save(os.path.join(segment_dir, "ids.npy"), np.array(sorted(set(article_ids)), dtype=str))
+
+    rows_exported = 0
+    for table, (id_column, columns) in SNAPSHOT_TABLES.items():
+        statement = f"SELECT {', '.join(column for column, _ in columns)} FROM {table}"
+        if article_ids is not None:
+            statement += f" WHERE {id_column} IN (SELECT article_id FROM snapshot_ids)"
+        cursor.execute(statement)
+        rows = cursor.fetchall()
+        rows_exported += len(rows)
+
+        for position, (column, kind) in enumerate(columns):
+            values = [row[position] for row in rows]
+            prefix = os.path.join(segment_dir, f"{table}.{column}")
+            if kind == "str":
+                codes, dictionary = _encode_strings(values)
+                np.save(prefix + ".codes.npy", codes)
+                np.save(prefix + ".values.npy", dictionary)
+            else:
+                np.save(prefix + ".npy", _encode_numbers(values))
+
+    if article_ids is not None:
+        cursor.execute("DROP TABLE snapshot_ids")
+
+    return rows_exported
+
+
+def build() -> dict:
+    """ Exports the metadata columns and junction tables of articles.db into a new snapshot
+
+    :return: dict -- Number of exported rows and size of the snapshot in bytes
+    """
+    with _lock:
+        if os.path.exists(constants.PATH_SNAPSHOT_DIR):
+            shutil.rmtree(constants.PATH_SNAPSHOT_DIR)
+        os.makedirs(constants.PATH_SNAPSHOT_DIR)
+
+        with sqlite3.connect(constants.PATH_DB) as connection:
+            rows = _write_segment(connection, "segment_00000", None)
+        _write_manifest({"segments": ["segment_00000"], "next_segment": 1})
+
+    size = sum(entry.stat().st_size for root, _, _ in os.walk(constants.PATH_SNAPSHOT_DIR)
+               for entry in os.scandir(root) if entry.is_file())
+    return {"rows": rows, "bytes": size}
+
+
+def refresh(article_ids: List[str]) -> None:
+    """ Brings the snapshot up to date after the given articles were inserted, updated or deleted
+
+    Does nothing if no snapshot was built. Appends a delta segment with the current rows of the articles,
+    deleted articles simply have no rows in it.
+
+    :param article_ids: List[str] -- Ids of the articles that were written
+    :return: None
+    """
+    if not article_ids or not exists():
+        return
+
+    with _lock:
+        manifest = _read_manifest()
+        if len(manifest["segments"]) >= MAX_SEGMENTS:
+            rebuild = True
+        else:
+            rebuild = False
+            segment = f"segment_{manifest['next_segment']:05d}"
+            with sqlite3.connect(constants.PATH_DB) as connection:
+                _write_segment(connection, segment, article_ids)
+            manifest["segments"].append(segment)
+            manifest["next_segment"] += 1
+            _write_manifest(manifest)
+
+    if rebuild:
+        build()
+
+
+def _load_segment_table(segment_dir: str, table: str) -> pd.DataFrame:
+    """ Maps the arrays of one table of a segment and wraps them into a DataFrame (strings as categoricals) """
+    data = {}
+    for column, kind in SNAPSHOT_TABLES[table][1]:
+        prefix = os.path.join(segment_dir, f"{table}.{column}")
+        if kind == "str":
+            codes = np.load(prefix + ".codes.npy", mmap_mode="r")
+            dictionary = np.load(prefix + ".values.npy", mmap_mode="r")
+            data[column] = pd.Categorical.from_codes(codes, categories=pd.Index(dictionary, dtype=object))
+        else:
+            data[column] = np.load(prefix + ".npy", mmap_mode="r")
+    return pd.DataFrame(data, copy=False)
+
+
+def load_tables() -> Union[None, Dict[str, pd.DataFrame]]:
+    """ Loads all tables of the snapshot as DataFrames
+
+    Rows of earlier segments whose article is covered by a later segment are filtered out vectorized.
+
+    :return: Union[None, Dict[str, pd.DataFrame]] -- DataFrame per table or None if no snapshot was built
+    """
+    if not exists():
+        return None
+
+    with _lock:
+        segments = _read_manifest()["segments"]
+        frames: Dict[str, List[pd.DataFrame]] = {table: [] for table in SNAPSHOT_TABLES}
+        superseded = np.empty(0, dtype=str)
+        for segment in reversed(segments):
+            segment_dir = os.path.join(constants.PATH_SNAPSHOT_DIR, segment)
+            for table, (id_column, _) in SNAPSHOT_TABLES.items():
+                df = _load_segment_table(segment_dir, table)
+                if len(superseded) > 0:
+                    df = df[~df[id_column].isin(superseded)]
+                frames[table].insert(0, df)
+
+            ids_path = os.path.join(segment_dir, "ids.npy")
+            if os.path.exists(ids_path):
+                superseded = np.concatenate([superseded, np.load(ids_path, mmap_mode="r")])
+
+    return {table: dfs[0] if len(dfs) == 1 else pd.concat(dfs, ignore_index=True) for table, dfs in frames.items()}
@@ -0,0 +1,244 @@
+""" Module that handles the TF-IDF index over the article texts used to find related articles
+
+The index stores the term counts of each article as sparse rows in segments (.npz files). The first segment is
+written by build(), every refresh after a write appends a segment with the new rows of the touched articles and
+their ids as removed, which supersedes their rows in all earlier segments. The vocabulary is append-only, each
+segment stores the terms it introduced. TF-IDF weights are derived from the counts when the index is loaded.
+"""
+import os
+import re
+import json
+import threading
+import numpy as np
+import scipy.sparse as sp
+
+import src.constants as constants
+
+from typing import List, Dict, Tuple, Union, Iterable
+
+# Number of segments from which a refresh merges all segments into one
+MAX_SEGMENTS = 16
+
+_TOKEN_PATTERN = re.compile(r"\w\w+")
+_MANIFEST = "manifest.json"
+_lock = threading.Lock()
+
+# Loaded index of this process: (manifest version, ids, TF-IDF matrix as CSR, same matrix as CSC)
+_cache: Union[None, tuple] = None
+
+
+def exists() -> bool:
+    """ Whether the index was built already """
+    return os.path.exists(os.path.join(constants.PATH_TFIDF_DIR, _MANIFEST))
+
+
+def _read_manifest() -> dict:
+    with open(os.path.join(constants.PATH_TFIDF_DIR, _MANIFEST)) as manifest_file:
+        return json.load(manifest_file)
+
+
+def _write_manifest(manifest: dict) -> None:
+    """ Replaces the manifest atomically, so readers see either the old or the new list of segments """
+    path = os.path.join(constants.PATH_TFIDF_DIR, _MANIFEST)
+    with open(path + ".tmp", "w") as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(path + ".tmp", path)
+
+
+def _read_vocabulary(segments: List[str]) -> List[str]:
+    """ Concatenates the terms introduced by the segments, position = column of the term """
+    vocabulary: List[str] = []
+    for segment in segments:
+        with np.load(os.path.join(constants.PATH_TFIDF_DIR, segment)) as arrays:
+            vocabulary.extend(arrays["terms"].tolist())
+    return vocabulary
+
+
+def _count_terms(texts: List[Union[str, None]], vocabulary: Dict[str, int], new_terms: List[str]) -> sp.csr_matrix:
+    """ Builds the sparse term count matrix of a batch of texts
+
+    Unknown terms are appended to vocabulary and new_terms. The term ids of the whole batch are collected in
+    flat arrays and summed up into counts by one COO -> CSR conversion.
+
+    :param texts: List[Union[str, None]]
+    :param vocabulary: Dict[str, int] -- Term -> column, extended in place
+    :param new_terms: List[str] -- Terms that were added to the vocabulary, extended in place
+    :return: sp.csr_matrix -- Counts of shape (len(texts), len(vocabulary))
+    """
+    rows: List[np.ndarray] = []
+    columns: List[np.ndarray] = []
+    for position, text in enumerate(texts):
+        tokens = _TOKEN_PATTERN.findall((text or "").lower())
+        for token in tokens:
+            if token not in vocabulary:
+                vocabulary[token] = len(vocabulary)
+                new_terms.append(token)
+        columns.append(np.fromiter((vocabulary[token] for token in tokens), dtype=np.int32, count=len(tokens)))
+        rows.append(np.full(len(tokens), position, dtype=np.int32))
+
+    row = np.concatenate(rows) if rows else np.empty(0, dtype=np.int32)
+    column = np.concatenate(columns) if columns else np.empty(0, dtype=np.int32)
+    counts = sp.coo_matrix((np.ones(len(row), dtype=np.float32), (row, column)),
+                           shape=(len(texts), len(vocabulary)))
+    return counts.tocsr()
+
+
+def _write_segment(segment: str, ids: List[str], counts: sp.csr_matrix, new_terms: List[str],
+                   removed: List[str]) -> None:
+    """ Saves the rows, ids, new terms and removed ids of one segment """
+    counts.sum_duplicates()
+    np.savez(os.path.join(constants.PATH_TFIDF_DIR, segment), data=counts.data, indices=counts.indices,
+             indptr=counts.indptr, ids=np.array(ids, dtype=str), terms=np.array(new_terms, dtype=str),
+             removed=np.array(removed, dtype=str))
+
+
+def build(batches: Iterable[List[Tuple[str, Union[str, None]]]]) -> int:
+    """ Builds the index from scratch
+
+    :param batches: Iterable[List[Tuple[str, Union[str, None]]]] -- Batches of (article_id, text)
+    :return: int -- Number of indexed articles
+    """
+    global _cache
+    with _lock:
+        os.makedirs(constants.PATH_TFIDF_DIR, exist_ok=True)
+        for file_name in os.listdir(constants.PATH_TFIDF_DIR):
+            os.remove(os.path.join(constants.PATH_TFIDF_DIR, file_name))
+
+        vocabulary: Dict[str, int] = {}
+        new_terms: List[str] = []
+        ids: List[str] = []
+        blocks: List[sp.csr_matrix] = []
+        for batch in batches:
+            blocks.append(_count_terms([text for _, text in batch], vocabulary, new_terms))
+            ids.extend(article_id for article_id, _ in batch)
+
+        # Earlier batches knew fewer terms, bring all blocks to the final number of columns
+        blocks = [sp.csr_matrix((block.data, block.indices, block.indptr), shape=(block.shape[0], len(vocabulary)))
+                  for block in blocks]
+        counts = sp.vstack(blocks, format="csr") if blocks else sp.csr_matrix((0, 0), dtype=np.float32)
+
+        _write_segment("segment_00000.npz", ids, counts, new_terms, [])
+        _write_manifest({"segments": ["segment_00000.npz"], "next_segment": 1, "version": 0})
+        _cache = None
+
+    return len(ids)
+
+
+def refresh(texts: Dict[str, Union[str, None]]) -> None:
+    """ Updates the index after articles were inserted, updated (new text) or deleted (text None)
+
+    Does nothing if the index was not built yet.
+
+    :param texts: Dict[str, Union[str, None]] -- article_id -> current text or None if it was deleted
+    :return: None
+    """
+    if not texts or not exists():
+        return
+
+    with _lock:
+        manifest = _read_manifest()
+        vocabulary = {term: column for column, term in enumerate(_read_vocabulary(manifest["segments"]))}
+        new_terms: List[str] = []
+        added = [(article_id, text) for article_id, text in texts.items() if text is not None]
+        counts = _count_terms([text for _, text in added], vocabulary, new_terms)
+
+        segment = f"segment_{manifest['next_segment']:05d}.npz"
+        _write_segment(segment, [article_id for article_id, _ in added], counts, new_terms, list(texts))
+        manifest["segments"].append(segment)
+        manifest["next_segment"] += 1
+        manifest["version"] += 1
+        _write_manifest(manifest)
+
+        if len(manifest["segments"]) >= MAX_SEGMENTS:
+            _compact(manifest)
+
+
+def _load_counts(segments: List[str]) -> Tuple[np.ndarray, sp.csr_matrix, List[str]]:
+    """ Loads the current rows of all segments, rows superseded by a later segment are dropped
+
+    :param segments: List[str] -- Segment file names in order
+    :return: Tuple[np.ndarray, sp.csr_matrix, List[str]] -- Article ids, term counts and vocabulary
+    """
+    vocabulary = _read_vocabulary(segments)
+    id_blocks: List[np.ndarray] = []
+    count_blocks: List[sp.csr_matrix] = []
+    removed = np.empty(0, dtype=str)
+    for segment in reversed(segments):
+        with np.load(os.path.join(constants.PATH_TFIDF_DIR, segment)) as arrays:
+            ids = arrays["ids"]
+            counts = sp.csr_matrix((arrays["data"], arrays["indices"], arrays["indptr"]),
+                                   shape=(len(ids), len(vocabulary)))
+            keep = ~np.isin(ids, removed) if len(removed) > 0 else np.ones(len(ids), dtype=bool)
+            id_blocks.insert(0, ids[keep])
+            count_blocks.insert(0, counts[keep])
+            removed = np.concatenate([removed, arrays["removed"]])
+
+    return np.concatenate(id_blocks), sp.vstack(count_blocks, format="csr"), vocabulary
+
+
+def _compact(manifest: dict) -> None:
+    """ Merges all segments into one (called with _lock held) """
+    ids, counts, vocabulary = _load_counts(manifest["segments"])
+    segment = f"segment_{manifest['next_segment']:05d}.npz"
+    _write_segment(segment, ids.tolist(), counts, vocabulary, [])
+    old_segments = manifest["segments"]
+    manifest["segments"] = [segment]
+    manifest["next_segment"] += 1
+    manifest["version"] += 1
+    _write_manifest(manifest)
+    for old_segment in old_segments:
+        os.remove(os.path.join(constants.PATH_TFIDF_DIR, old_segment))
+
+
+def _load() -> Tuple[np.ndarray, sp.csr_matrix, sp.csc_matrix]:
+    """ Returns the article ids and the l2-normalized TF-IDF matrix, cached until the index changes
+
+    The matrix is kept as CSR to get the row of an article and as CSC to get the columns of its terms.
+    """
+    global _cache
+    with _lock:
+        manifest = _read_manifest()
+        if _cache is not None and _cache[0] == manifest["version"]:
+            return _cache[1:]
+
+        ids, counts, _ = _load_counts(manifest["segments"])
+
+        # Sublinear term frequency and smoothed inverse document frequency
+        weights = counts.copy()
+        weights.data = 1 + np.log(weights.data)
+        document_frequency = np.bincount(counts.indices, minlength=counts.shape[1])
+        idf = np.log((1 + len(ids)) / (1 + document_frequency)) + 1
+        weights = weights.multiply(idf[None, :]).tocsr()
+        norms = np.sqrt(np.asarray(weights.multiply(weights).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        weights = (sp.diags(1 / norms) @ weights).tocsr()
+
+        _cache = (manifest["version"], ids, weights, weights.tocsc())
+        return _cache[1:]
+
+
+def related(article_id: str, k: int = 10) -> Union[None, List[Tuple[str, float]]]:
+    """ Returns the k articles most similar to the given one by cosine similarity of their TF-IDF vectors
+
+    Only the columns of the terms of the given article are multiplied, so the cost depends on how many
+    articles share its terms and not on the size of the corpus. The top k are selected with np.argpartition.
+
+    :param article_id: str
+    :param k: int -- Number of related articles
+    :return: Union[None, List[Tuple[str, float]]] -- (article_id, similarity) pairs, None if it is not indexed
+    """
+    ids, rows, columns = _load()
+    positions = np.flatnonzero(ids == article_id)
+    if len(positions) == 0:
+        return None
+
+    query = rows[positions[0], :].tocoo()
+    scores = columns[:, query.col] @ query.data
+    scores[positions[0]] = -1
+
+    k = min(k, len(ids) - 1)
+    if k <= 0:
+        return []
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top], kind="stable")]
+    return [(str(ids[position]), float(scores[position])) for position in top if scores[position] > 0]
@@ -0,0 +1,313 @@
+""" Module that handles the watch mode, which keeps articles.db in sync with the JSON files of a directory
+
+Changes are detected with inotify on Linux (via ctypes, no extra dependency) and by polling the file stats
+otherwise. Changed paths are collected and applied as small debounced batches: new and modified files through
+upsertMany(), deleted files through deleteMany(). Which file holds which article is stored in the source_file
+table, so changes made while nobody was watching are caught up on the next start.
+"""
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading
+
+import src.constants as constants
+import src.crud_interface as crud_interface
+
+from collections import Counter
+from typing import List, Dict, Tuple, Union
+
+# inotify event masks, see inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+_WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class Inotify:
+    """
+    Minimal recursive inotify wrapper, raises OSError if inotify is not available
+    """
+
+    def __init__(self, root: str):
+        """
+        :param root: str -- Directory to watch including all its subdirectories
+        """
+        if not sys.platform.startswith("linux"):
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches: Dict[int, str] = {}
+        self.add_tree(root)
+
+    def add_tree(self, root: str) -> None:
+        """ Watches the directory and all its subdirectories except the DERIVED_DATA_DIRS of crud_interface """
+        for dir_path, dirs, _ in os.walk(root):
+            if crud_interface.is_derived_data_dir(dir_path):
+                dirs.clear()
+                continue
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dir_path), _WATCH_MASK)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {dir_path}")
+            self.watches[wd] = dir_path
+
+    def read(self, timeout: float) -> List[Tuple[Union[str, None], int]]:
+        """ Waits up to timeout seconds for events
+
+        :param timeout: float
+        :return: List[Tuple[Union[str, None], int]] -- (path, mask) per event, path is None if events were lost
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += _EVENT_HEADER.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                events.append((None, mask))
+            elif mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+            elif wd in self.watches:
+                path = os.path.join(self.watches[wd], os.fsdecode(name))
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    self.add_tree(path)
+                events.append((path, mask))
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class Watcher:
+    """
+    Class to keep articles.db in sync with the JSON files of a directory
+    """
+
+    def __init__(self, root: str, use_inotify: bool = True):
+        """
+        :param root: str -- Directory with the JSON files, e.g. 'data'
+        :param use_inotify: bool -- Whether to try inotify before falling back to polling
+        """
+        self.root = os.path.normpath(root)
+        self.state: Dict[str, tuple] = {path: values for path, values in crud_interface.load_source_files().items()
+                                        if self._is_watched(path)}
+        self.article_refs = Counter(article_id for article_id, _, _ in self.state.values())
+        self.pending: Dict[str, float] = {}
+        self.unreadable: Dict[str, tuple] = {}
+        self.last_event = 0.0
+        # Changes found by a scan happened after the previous scan (or after the watcher started)
+        self.last_scan = time.time()
+
+        self.inotify = None
+        if use_inotify:
+            try:
+                self.inotify = Inotify(self.root)
+            except (OSError, AttributeError):
+                self.inotify = None
+        self.mode = "inotify" if self.inotify is not None else "polling"
+
+        # Metrics over all batches
+        self.batches = 0
+        self.files_applied = 0
+        self.files_failed = 0
+        self.busy_seconds = 0.0
+        self.max_lag = 0.0
+
+    def _is_watched(self, path: str) -> bool:
+        """ Whether the path lies below the root """
+        return os.path.commonpath([os.path.abspath(path), os.path.abspath(self.root)]) == os.path.abspath(self.root)
+
+    def _mark(self, path: str, changed: float) -> None:
+        """ Remembers a changed path, keeping the time of its first change for the lag metric
+
+        :param path: str
+        :param changed: float -- When the change happened (event time or, for polled changes, the mtime)
+        :return: None
+        """
+        self.pending.setdefault(path, changed)
+        self.last_event = time.time()
+
+    def scan(self) -> None:
+        """ Compares the directory with the known files and marks every difference (polling and catch-up)
+
+        Modified files are stamped with their mtime, so the lag includes the time until the scan noticed them.
+        The mtime is clamped to the previous scan, e.g. for files copied with their original mtime. Deletions
+        have no timestamp and are stamped with the time of the scan.
+        """
+        now = time.time()
+        seen = set()
+        for path in crud_interface.get_path_to_data(root_dir=self.root):
+            path = os.path.normpath(path)
+            seen.add(path)
+            known = self.state.get(path)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if known is None or known[1:] != (stat.st_mtime_ns, stat.st_size):
+                self._mark(path, min(now, max(stat.st_mtime, self.last_scan)))
+        for path in self.state.keys() - seen:
+            self._mark(path, now)
+        self.last_scan = now
+
+    def _handle_events(self, events: List[Tuple[Union[str, None], int]]) -> None:
+        now = time.time()
+        for path, mask in events:
+            if path is None:
+                # The kernel dropped events, fall back to comparing everything once
+                self.scan()
+            elif mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    for file_path in crud_interface.get_path_to_data(root_dir=path):
+                        self._mark(os.path.normpath(file_path), now)
+                else:
+                    prefix = path + os.sep
+                    for known_path in [p for p in self.state if p.startswith(prefix)]:
+                        self._mark(known_path, now)
+            elif path.endswith(".json"):
+                self._mark(path, now)
+
+    def _is_due(self) -> bool:
+        """ Whether the pending paths should be applied now (debounced, but bounded in size and delay) """
+        if not self.pending:
+            return False
+        now = time.time()
+        return (now - self.last_event >= constants.WATCH_DEBOUNCE
+                or len(self.pending) >= constants.WATCH_MAX_BATCH
+                or now - min(self.pending.values()) >= constants.WATCH_MAX_DELAY)
+
+    def flush(self) -> Union[None, dict]:
+        """ Applies the pending paths as one batch
+
+        :return: Union[None, dict] -- Metrics of the batch or None if nothing had to be applied
+        """
+        start_time = time.time()
+        pending = dict(list(self.pending.items())[:constants.WATCH_MAX_BATCH])
+        for path in pending:
+            del self.pending[path]
+
+        # Split the paths into (new or modified) files to parse and deleted files
+        parsed = []
+        deleted: List[str] = []
+        failed = 0
+        for path in pending:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                if path in self.state:
+                    deleted.append(path)
+                continue
+            known = self.state.get(path)
+            if known is not None and known[1:] == (stat.st_mtime_ns, stat.st_size):
+                continue
+            if self.unreadable.get(path) == (stat.st_mtime_ns, stat.st_size):
+                continue
+            try:
+                article = crud_interface.load_articles_from_paths([path])[0]
+            except (ValueError, TypeError, KeyError, UnicodeDecodeError):
+                # E.g. a file that is still being written, it is retried once it changes again
+                self.unreadable[path] = (stat.st_mtime_ns, stat.st_size)
+                failed += 1
+                continue
+            self.unreadable.pop(path, None)
+            parsed.append((path, article, stat))
+
+        if not parsed and not deleted:
+            self.files_failed += failed
+            return None
+
+        counts = crud_interface.upsertMany([article for _, article, _ in parsed]) if parsed else {}
+
+        # Update the known files and delete the articles that no file holds anymore
+        source_files: Dict[str, Union[tuple, None]] = {}
+        released: List[str] = []
+        for path in deleted:
+            released.append(self.state.pop(path)[0])
+            source_files[path] = None
+        for path, article, stat in parsed:
+            if path in self.state:
+                released.append(self.state[path][0])
+            self.state[path] = (article.id, stat.st_mtime_ns, stat.st_size)
+            self.article_refs[article.id] += 1
+            source_files[path] = self.state[path]
+        for article_id in released:
+            self.article_refs[article_id] -= 1
+        orphaned = sorted({article_id for article_id in released if self.article_refs[article_id] <= 0})
+        for article_id in orphaned:
+            del self.article_refs[article_id]
+
+        articles_to_delete = [article for article in crud_interface.readMany(orphaned) if article is not None]
+        if articles_to_delete:
+            crud_interface.deleteMany(articles_to_delete)
+        crud_interface.save_source_files(source_files)
+
+        # Metrics of the batch
+        finished = time.time()
+        duration = finished - start_time
+        lag = finished - min(pending.values())
+        self.batches += 1
+        self.files_applied += len(parsed) + len(deleted)
+        self.files_failed += failed
+        self.busy_seconds += duration
+        self.max_lag = max(self.max_lag, lag)
+        return {
+            "files": len(parsed) + len(deleted),
+            "inserted": counts.get("inserted", 0),
+            "updated": counts.get("updated", 0),
+            "unchanged": counts.get("unchanged", 0),
+            "deleted": len(articles_to_delete),
+            "failed": failed,
+            "seconds": duration,
+            "lag": lag
+        }
+
+    def run(self, stop_event: Union[threading.Event, None] = None, verbose: bool = True) -> None:
+        """ Watches the directory until stop_event is set (or forever), applying changes in debounced batches
+
+        :param stop_event: Union[threading.Event, None] -- Event to stop watching, e.g. from another thread
+        :param verbose: bool -- Whether to print the metrics of each batch
+        :return: None
+        """
+        stop_event = stop_event or threading.Event()
+        self.scan()
+        try:
+            while not stop_event.is_set():
+                if self.inotify is not None:
+                    self._handle_events(self.inotify.read(timeout=constants.WATCH_DEBOUNCE))
+                elif time.time() - self.last_scan >= constants.WATCH_POLL_INTERVAL:
+                    self.scan()
+                else:
+                    stop_event.wait(min(constants.WATCH_DEBOUNCE, constants.WATCH_POLL_INTERVAL))
+
+                while self._is_due() or (self.pending and stop_event.is_set()):
+                    metrics = self.flush()
+                    if verbose and metrics is not None:
+                        print(f"Applied {metrics['files']} files: {metrics['inserted']} inserted, "
+                              f"{metrics['updated']} updated, {metrics['unchanged']} unchanged, "
+                              f"{metrics['deleted']} deleted, {metrics['failed']} unreadable "
+                              f"in {metrics['seconds']:.2f}s ({metrics['files'] / max(metrics['seconds'], 1e-9):.0f} "
+                              f"files/s), lag {metrics['lag']:.2f}s")
+        finally:
+            if self.inotify is not None:
+                self.inotify.close()